@@ -0,0 +1,75 @@
+"""
+Content access checks.
+
+Whether a user may read a book's content depends on their active borrowings.
+The set of borrowed book ids is cached per borrower email in the configured
+cache backend, so steady-state checks cost no queries. Like the fragment
+versions (library/fragments.py), each email has a version token that
+library/signals.py deletes whenever one of that borrower's Borrowing rows
+changes. A cached set is only used under the version it was read with, so a
+set queried before a change but stored after its invalidation is never
+served.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+
+from .models import Borrowing
+
+
+def _digest(email):
+    # Emails may contain characters memcached rejects in keys
+    return hashlib.md5(email.lower().encode()).hexdigest()
+
+
+def _cache_key(email):
+    return f'library:borrowed-books:{_digest(email)}'
+
+
+def _version_key(email):
+    return f'library:borrowed-books-version:{_digest(email)}'
+
+
+def get_borrowed_book_ids(user):
+    """Ids of the books `user` currently has borrowed (not returned)"""
+    if not user.is_authenticated or not user.email:
+        return frozenset()
+    key, version_key = _cache_key(user.email), _version_key(user.email)
+    found = cache.get_many([key, version_key])
+    version = found.get(version_key)
+    if version is None:
+        version = uuid.uuid4().hex[:12]
+        # No expiry: an evicted token only costs one more query
+        cache.set(version_key, version, timeout=None)
+    cached = found.get(key)
+    if cached is not None and cached[0] == version:
+        return frozenset(cached[1])
+    # Version first: a change committed during the query leaves this set already stale.
+    # Filled from the primary, a lagging read replica would cache a stale set
+    book_ids = list(
+        Borrowing.objects.using(router.db_for_write(Borrowing)).filter(
+            borrower_email=user.email,
+            is_returned=False
+        ).values_list('book_id', flat=True)
+    )
+    cache.set(key, (version, book_ids), getattr(settings, 'LIBRARY_BORROWED_CACHE_TIMEOUT', 86400))
+    return frozenset(book_ids)
+
+
+def can_access_content(user, book):
+    """Admins can always access, other users only while they have the book borrowed"""
+    if not user.is_authenticated:
+        return False
+    if user.is_staff:
+        return True
+    return book.pk in get_borrowed_book_ids(user)
+
+
+def invalidate_borrowed_book_ids(email):
+    """Expire the cached set for `email` once the current transaction commits"""
+    if email:
+        key = _version_key(email)
+        transaction.on_commit(lambda: cache.delete(key))
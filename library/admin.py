@@ -20,6 +20,7 @@ class BookAdmin(admin.ModelAdmin):
     list_display = ['title', 'author', 'genre', 'status', 'available_copies', 'total_copies', 'has_content', 'created_at']
     list_filter = ['status', 'genre', 'author', 'created_at']
     search_fields = ['title', 'isbn', 'author__name']
+    list_select_related = ['author', 'genre']
     readonly_fields = ['created_at', 'updated_at']
     
     def has_content(self, obj):
@@ -33,5 +34,6 @@ class BorrowingAdmin(admin.ModelAdmin):
     list_display = ['book', 'borrower_name', 'borrow_date', 'due_date', 'is_returned', 'return_date']
     list_filter = ['is_returned', 'borrow_date', 'due_date']
     search_fields = ['book__title', 'borrower_name', 'borrower_email']
+    list_select_related = ['book__author']
     readonly_fields = ['created_at', 'updated_at']
 
@@ -5,3 +5,10 @@ class LibraryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'library'
 
+    def ready(self):
+        from django.core.signals import request_started
+
+        from . import autocomplete, db, performance, signals  # noqa: F401
+
+        # Built when serving starts rather than here, management commands never need it
+        request_started.connect(autocomplete.warm_up, dispatch_uid='library.autocomplete.warm_up')
@@ -0,0 +1,203 @@
+"""
+Native async versions of the read-heavy views, for ASGI deployments.
+
+library/urls.py routes to these instead of their library/views.py
+counterparts when LIBRARY_ASYNC_VIEWS is on. Queries use the async ORM and
+content files are streamed with an async iterator, so an ASGI worker does not
+hold a thread per reader. Work that is still sync-only in Django 4.2 (the lazy
+request.user, template rendering with the messages/session context) is run
+through sync_to_async.
+"""
+import os
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404
+from django.shortcuts import redirect, render
+
+from .access import can_access_content, get_borrowed_book_ids
+from .conditional import book_last_modified, conditional_page
+from .content import serve_content_file
+from .db import use_read_replica
+from .fragments import attach_fragment_versions, fragment_timeout, get_book_versions
+from .forms import SearchForm
+from .pagecache import book_tag, cache_anonymous_page
+from .pages import current_pages, is_pdf, whole_file_page_url
+from .models import Book, Borrowing
+from .pagination import StaleCursor, apaginate
+from .search import get_search_backend
+from .stats import get_stats
+from .views import BOOK_CARD_FIELDS
+
+
+async def get_request_user(request):
+    """Resolve the lazy request.user (session + user lookup) off the event loop"""
+    def resolve():
+        request.user.is_authenticated  # forces the lookup
+        return request.user
+    return await sync_to_async(resolve)()
+
+
+async def arender(request, template_name, context):
+    return await sync_to_async(render)(request, template_name, context)
+
+
+async def get_book_or_404(queryset, pk):
+    try:
+        return await queryset.aget(pk=pk)
+    except Book.DoesNotExist:
+        raise Http404('No Book matches the given query.')
+
+
+@cache_anonymous_page(['books', 'authors', 'genres'])
+@use_read_replica
+async def home(request):
+    """Home page with statistics and recent books"""
+    await get_request_user(request)
+    stats = await sync_to_async(get_stats)()
+    recent_books = [
+        book async for book in Book.objects.select_related('author', 'genre').only(
+            *BOOK_CARD_FIELDS, 'author__name', 'genre__name'
+        )[:6]
+    ]
+
+    context = {
+        'total_books': stats.total_books,
+        'total_authors': stats.total_authors,
+        'total_genres': stats.total_genres,
+        'borrowed_books': stats.borrowed_books,
+        'available_books': stats.available_books,
+        'recent_books': recent_books,
+    }
+    return await arender(request, 'library/home.html', context)
+
+
+@cache_anonymous_page(['books', 'authors', 'genres'])
+@use_read_replica
+async def book_list(request):
+    """List all books with search and filter"""
+    user = await get_request_user(request)
+    form = SearchForm(request.GET)
+    books = Book.objects.select_related('author', 'genre').only(
+        *BOOK_CARD_FIELDS, 'author__name', 'genre__name'
+    )
+
+    ordering = ('title', 'pk')
+    # Validating the genre choice queries the database
+    if await sync_to_async(form.is_valid)():
+        query = form.cleaned_data.get('query')
+        genre = form.cleaned_data.get('genre')
+
+        if query:
+            books = get_search_backend().search(books, query)
+            ordering = None
+
+        if genre:
+            books = books.filter(genre=genre)
+
+    try:
+        page_obj = await apaginate(request, books, 12, ordering)
+    except StaleCursor as stale:
+        return redirect(stale.url)
+    await sync_to_async(attach_fragment_versions)(page_obj)
+
+    user_borrowed_books = set()
+    if user.is_authenticated and not user.is_staff:
+        user_borrowed_books = await sync_to_async(get_borrowed_book_ids)(user)
+
+    context = {
+        'page_obj': page_obj,
+        'form': form,
+        'user_borrowed_books': user_borrowed_books,
+        'fragment_timeout': fragment_timeout(),
+    }
+    return await arender(request, 'library/book_list.html', context)
+
+
+@use_read_replica
+@conditional_page(book_last_modified)
+@cache_anonymous_page(lambda pk: [book_tag(pk)])
+async def book_detail(request, pk):
+    """Book detail page"""
+    user = await get_request_user(request)
+    fragment_version = (await sync_to_async(get_book_versions)([pk]))[pk]
+    book = await get_book_or_404(Book.objects.select_related('author', 'genre'), pk)
+    book.fragment_version = fragment_version
+
+    borrowings = []
+    if user.is_staff:
+        borrowings = [
+            borrowing async for borrowing in Borrowing.objects.filter(book=book, is_returned=False).only(
+                'borrower_name', 'borrower_email', 'borrow_date', 'due_date'
+            )
+        ]
+
+    context = {
+        'book': book,
+        'borrowings': borrowings,
+        'user_has_borrowed': await sync_to_async(can_access_content)(user, book),
+        'fragment_timeout': fragment_timeout(),
+    }
+    return await arender(request, 'library/book_detail.html', context)
+
+
+async def _serve_content(request, pk, disposition_type, denied_message):
+    user = await get_request_user(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    book = await get_book_or_404(Book.objects.only('content_file'), pk)
+    if not book.content_file:
+        raise Http404("Book content not available")
+
+    # Check if user has borrowed this book (not returned)
+    # Admins can always access
+    if not await sync_to_async(can_access_content)(user, book):
+        messages.error(request, denied_message)
+        return redirect('book_detail', pk=book.pk)
+
+    if disposition_type == 'inline':
+        disposition = f'inline; filename="{book.content_file.name}"'
+    else:
+        disposition = f'attachment; filename="{os.path.basename(book.content_file.name)}"'
+    return serve_content_file(request, book.content_file, disposition, use_async=True)
+
+
+async def book_content_view(request, pk):
+    """View book content (PDF/document) - Only for users who borrowed the book"""
+    return await _serve_content(
+        request, pk, 'inline', 'You must borrow this book first to view its content.'
+    )
+
+
+async def book_content_download(request, pk):
+    """Download book content - Only for users who borrowed the book"""
+    return await _serve_content(
+        request, pk, 'attachment', 'You must borrow this book first to download its content.'
+    )
+
+
+async def book_content_page(request, pk, number):
+    """One page of the book content as a single-page PDF - Only for users who borrowed the book"""
+    user = await get_request_user(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    book = await get_book_or_404(Book.objects.only('content_file'), pk)
+    if not book.content_file:
+        raise Http404("Book content not available")
+
+    if not await sync_to_async(can_access_content)(user, book):
+        messages.error(request, 'You must borrow this book first to view its content.')
+        return redirect('book_detail', pk=book.pk)
+
+    # Split by library/pages.py
+    page = await current_pages(book).filter(number=number).only('file').afirst()
+    if page is None:
+        if number < 1 or not is_pdf(book.content_file) or await current_pages(book).aexists():
+            raise Http404("Page not found")
+        # Not split (yet): the whole file, opened at that page
+        return redirect(whole_file_page_url(book, number))
+    disposition = f'inline; filename="{os.path.basename(page.file.name)}"'
+    return serve_content_file(request, page.file, disposition, use_async=True)
@@ -0,0 +1,47 @@
+"""
+Cached user lookups for authenticated requests.
+
+AuthenticationMiddleware loads request.user through the backend's
+get_user() on every request. CachedModelBackend keeps the User row in the
+cache, and library/signals.py drops it when the user is saved (which
+includes password changes and the last_login update), deleted or logs out.
+With SESSION_ENGINE = cached_db the session is read from the cache too, so a
+steady-state authenticated request runs neither query.
+
+The session auth hash is still verified against the cached row's password,
+so a password change on another device logs the other sessions out as before.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _cache_key(user_id):
+    return f'library:user:{user_id}'
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose per-request user lookup is served from the cache"""
+
+    def get_user(self, user_id):
+        key = _cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            UserModel = get_user_model()
+            try:
+                user = UserModel._default_manager.get(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            cache.set(key, user, getattr(settings, 'LIBRARY_USER_CACHE_TIMEOUT', 60 * 60))
+        return user if self.user_can_authenticate(user) else None
+
+
+def invalidate_cached_user(user_id):
+    """Forget the cached row of `user_id` now and once the current transaction commits"""
+    if user_id is not None:
+        key = _cache_key(user_id)
+        # Immediately as well, so the rest of this request never sees the old row
+        cache.delete(key)
+        transaction.on_commit(lambda: cache.delete(key))
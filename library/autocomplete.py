@@ -0,0 +1,250 @@
+"""
+In-process prefix index for search-as-you-type suggestions.
+
+Every word-start suffix of a book title or author name, and each ISBN, is
+kept in one sorted list of (key, kind, pk, rank) tuples, so a lookup is a
+bisect to the first key >= the typed prefix followed by a short bounded scan.
+No query is made once the index is built.
+
+The index is built in a background thread when the process serves its first
+request and kept current by the Book/Author receivers in library/signals.py.
+Those only reach the process that made the change, so with several worker
+processes each one also rebuilds its index after LIBRARY_AUTOCOMPLETE_MAX_AGE
+seconds. A rebuild fills a new PrefixIndex and swaps it in; until then
+lookups keep using the old one (or suggest nothing before the first build),
+so no request waits for the two full-table queries. Changes committed while
+a rebuild runs are replayed onto the new index before the swap.
+"""
+import bisect
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.urls import reverse
+
+from .models import Author, Book
+
+
+MAX_WORDS = 12  # word-start keys per title, bounds the index size for long titles
+MAX_SCAN = 200  # entries looked at per lookup before ranking
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(text):
+    return ' '.join((text or '').casefold().split())
+
+
+def _word_keys(text):
+    """'The Lord of the Rings' -> 'the lord of the rings', 'lord of the rings', ..."""
+    words = normalize(text).split(' ')
+    return [' '.join(words[i:]) for i in range(min(len(words), MAX_WORDS)) if words[i]]
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = []
+        self._keys_by_ref = {}
+        self._labels = {}
+        self.built_at = None
+
+    def _entries_for(self, kind, pk, label, isbn=None):
+        entries = [(key, kind, pk, 0 if i == 0 else 1) for i, key in enumerate(_word_keys(label))]
+        if isbn:
+            entries.append((isbn.replace('-', '').lower(), kind, pk, 0))
+        return entries
+
+    def build(self):
+        """Load every book and author (two queries) into this index"""
+        entries, keys_by_ref, labels = [], {}, {}
+        books = Book.objects.values_list('pk', 'title', 'isbn', 'author__name').order_by()
+        for pk, title, isbn, author_name in books.iterator(chunk_size=5000):
+            ref = ('book', pk)
+            keys_by_ref[ref] = self._entries_for('book', pk, title, isbn)
+            labels[ref] = (title, author_name)
+            entries.extend(keys_by_ref[ref])
+        for pk, name in Author.objects.values_list('pk', 'name').order_by().iterator(chunk_size=5000):
+            ref = ('author', pk)
+            keys_by_ref[ref] = self._entries_for('author', pk, name)
+            labels[ref] = (name, '')
+            entries.extend(keys_by_ref[ref])
+        entries.sort()
+        with self._lock:
+            self._entries, self._keys_by_ref, self._labels = entries, keys_by_ref, labels
+            self.built_at = time.monotonic()
+
+    def _remove(self, ref):
+        for entry in self._keys_by_ref.pop(ref, ()):
+            i = bisect.bisect_left(self._entries, entry)
+            if i < len(self._entries) and self._entries[i] == entry:
+                del self._entries[i]
+        self._labels.pop(ref, None)
+
+    def _add(self, kind, pk, label, detail, isbn=None):
+        ref = (kind, pk)
+        self._remove(ref)
+        entries = self._entries_for(kind, pk, label, isbn)
+        for entry in entries:
+            bisect.insort(self._entries, entry)
+        self._keys_by_ref[ref] = entries
+        self._labels[ref] = (label, detail)
+
+    def add_book(self, pk, title, isbn, author_name):
+        with self._lock:
+            self._add('book', pk, title, author_name, isbn)
+
+    def add_author(self, pk, name, book_ids=()):
+        """Add or rename an author, `book_ids` get the new name as their detail"""
+        with self._lock:
+            self._add('author', pk, name, '')
+            for book_id in book_ids:
+                label = self._labels.get(('book', book_id))
+                if label:
+                    self._labels[('book', book_id)] = (label[0], name)
+
+    def remove(self, kind, pk):
+        with self._lock:
+            self._remove((kind, pk))
+
+    def lookup(self, prefix, limit=8):
+        """
+        Up to `limit` (kind, pk, label, detail) matches for `prefix`, matches at
+        the start of a title/name first, then shorter labels
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        matches = {}
+        with self._lock:
+            i = bisect.bisect_left(self._entries, (prefix,))
+            for key, kind, pk, rank in self._entries[i:i + MAX_SCAN]:
+                if not key.startswith(prefix):
+                    break
+                ref = (kind, pk)
+                if rank < matches.get(ref, 2):
+                    matches[ref] = rank
+            labels = {ref: self._labels[ref] for ref in matches}
+        ranked = sorted(matches, key=lambda ref: (matches[ref], len(labels[ref][0]), labels[ref][0]))
+        return [(kind, pk) + labels[(kind, pk)] for kind, pk in ranked[:limit]]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_index = None
+# Held from scheduling a rebuild until it is swapped in, so only one runs
+_build_lock = threading.Lock()
+# Guards swapping _index and the change journal kept during a rebuild
+_swap_lock = threading.Lock()
+_journal = None
+
+
+def _rebuild():
+    """Build a new index and swap it in, called with _build_lock held"""
+    global _index, _journal
+    try:
+        with _swap_lock:
+            _journal = []
+        index = PrefixIndex()
+        index.build()
+        with _swap_lock:
+            # Replaying is idempotent, changes the build already saw are harmless
+            for method, args in _journal:
+                getattr(index, method)(*args)
+            _index = index
+    finally:
+        with _swap_lock:
+            _journal = None
+        _build_lock.release()
+
+
+def _rebuild_in_background():
+    try:
+        _rebuild()
+    except Exception:
+        logger.warning('Could not build the autocomplete index', exc_info=True)
+    finally:
+        # The thread's own connections, nothing else closes them
+        connections.close_all()
+
+
+def rebuild(wait=True):
+    """
+    Rebuild the index, in this thread or (wait=False) a background one.
+    Returns False when another rebuild is already running.
+    """
+    if not _build_lock.acquire(blocking=False):
+        return False
+    if wait:
+        _rebuild()
+        return True
+    try:
+        threading.Thread(target=_rebuild_in_background, name='autocomplete-index', daemon=True).start()
+    except Exception:
+        _build_lock.release()
+        raise
+    return True
+
+
+def warm_up(**kwargs):
+    """request_started receiver building the index once, when the process starts serving"""
+    request_started.disconnect(dispatch_uid='library.autocomplete.warm_up')
+    if _index is None:
+        rebuild(wait=False)
+
+
+def get_index():
+    """The current index, None before the first build; schedules a rebuild when it is too old"""
+    index = _index
+    max_age = getattr(settings, 'LIBRARY_AUTOCOMPLETE_MAX_AGE', 600)
+    if index is None or (max_age is not None and time.monotonic() - index.built_at > max_age):
+        rebuild(wait=False)
+    return index
+
+
+def tracking_changes():
+    """False until an index exists or is being built (nothing to keep current)"""
+    return _index is not None or _journal is not None
+
+
+def _apply(method, *args):
+    with _swap_lock:
+        index = _index
+        if _journal is not None:
+            _journal.append((method, args))
+    if index is not None:
+        getattr(index, method)(*args)
+
+
+def add_book(pk, title, isbn, author_name):
+    _apply('add_book', pk, title, isbn, author_name)
+
+
+def add_author(pk, name, book_ids=()):
+    _apply('add_author', pk, name, book_ids)
+
+
+def remove(kind, pk):
+    _apply('remove', kind, pk)
+
+
+def suggest(query, limit=8):
+    """JSON-ready suggestions for the autocomplete endpoint"""
+    index = get_index()
+    if index is None:
+        return []
+    results = []
+    for kind, pk, label, detail in index.lookup(query, limit):
+        url_name = 'book_detail' if kind == 'book' else 'author_detail'
+        results.append({
+            'type': kind,
+            'id': pk,
+            'label': label,
+            'detail': detail,
+            'url': reverse(url_name, args=[pk]),
+        })
+    return results
@@ -0,0 +1,140 @@
+"""
+ETag/Last-Modified validation of the book and author detail pages.
+
+Last-Modified is the newest updated_at of everything a page shows: the book
+with its author, genre and active borrowings, or the author with their books.
+The ETag adds who is looking, since the navigation and the borrow/staff
+sections differ per user. A matching If-None-Match or If-Modified-Since is
+answered with 304 after that single query, without rendering the page.
+
+Borrows and returns touch Book.updated_at through checkout_copy() and
+release_copy(); removals that leave no newer row behind (a deleted book or
+borrowing, a book moved to another author, a deleted genre) touch the
+remaining parent in library/signals.py so its timestamp still moves forward.
+
+The validators always come from the primary. In a @use_read_replica view the
+timestamp is looked up on the replica as well, and when the replica has not
+caught up with the page yet the page is rendered from the primary too, so an
+ETag never labels an older body.
+
+If-Modified-Since compares whole seconds, so a change within the same second
+as the one a client saw would still be answered with 304 to clients that send
+no ETag. Last-Modified is therefore only sent once its second is over; a
+later change always falls in a later second. The ETag uses the full
+timestamp and is sent every time.
+"""
+import contextlib
+import functools
+import hashlib
+import time
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib.messages import get_messages
+from django.db.models import Max, OuterRef, Subquery
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .db import primary_reads, reading_from_replica
+from .models import Author, Book, Borrowing
+
+
+def _newest(*timestamps):
+    timestamps = [timestamp for timestamp in timestamps if timestamp is not None]
+    return max(timestamps) if timestamps else None
+
+
+def book_last_modified(pk):
+    newest_borrowing = Borrowing.objects.filter(
+        book=OuterRef('pk'), is_returned=False
+    ).order_by().values('book').annotate(newest=Max('updated_at')).values('newest')
+    row = Book.objects.filter(pk=pk).values_list(
+        'updated_at', 'author__updated_at', 'genre__updated_at', Subquery(newest_borrowing)
+    ).first()
+    return _newest(*row) if row else None
+
+
+def author_last_modified(pk):
+    newest_book = Book.objects.filter(
+        author=OuterRef('pk')
+    ).order_by().values('author').annotate(newest=Max('updated_at')).values('newest')
+    row = Author.objects.filter(pk=pk).values_list('updated_at', Subquery(newest_book)).first()
+    return _newest(*row) if row else None
+
+
+def _validators(request, view_name, last_modified_func, kwargs):
+    """
+    ((etag, last_modified) of a page or None when it can't be validated,
+    whether the page must be rendered from the primary)
+    """
+    # Pending flash messages have to be rendered into the page
+    if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+        return None, False
+    with primary_reads():
+        last_modified = last_modified_func(**kwargs)
+    # The replica is behind on what this page shows
+    use_primary = reading_from_replica() and last_modified_func(**kwargs) != last_modified
+    if last_modified is None:
+        # Missing object, the view answers 404
+        return None, use_primary
+    user = request.user
+    identity = f'{user.pk}:{user.get_username()}:{user.is_staff}' if user.is_authenticated else 'anonymous'
+    digest = hashlib.md5(
+        f'{view_name}:{sorted(kwargs.items())}:{last_modified.isoformat()}:{identity}'.encode()
+    ).hexdigest()
+    return (f'W/"{digest}"', last_modified), use_primary
+
+
+def _not_modified(request, validators):
+    etag, last_modified = validators
+    return get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+
+
+def _add_validators(request, response, validators):
+    if validators is not None and response.status_code in (200, 304):
+        etag, last_modified = validators
+        response['ETag'] = etag
+        # Only for a second that is over, see the module docstring
+        if int(time.time()) > int(last_modified.timestamp()):
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Revalidate on every visit instead of guessing freshness from Last-Modified
+    patch_cache_control(response, no_cache=True)
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def conditional_page(last_modified_func):
+    """
+    Answer conditional GETs of a detail view from last_modified_func(**url_kwargs),
+    the newest change of what the page shows (None when the object is missing).
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                # Session, user and timestamp lookups all stay off the event loop
+                validators, use_primary = await sync_to_async(_validators)(
+                    request, view.__name__, last_modified_func, kwargs
+                )
+                if validators is not None:
+                    response = _not_modified(request, validators)
+                    if response is not None:
+                        return await sync_to_async(_add_validators)(request, response, validators)
+                with primary_reads() if use_primary else contextlib.nullcontext():
+                    response = await view(request, *args, **kwargs)
+                return await sync_to_async(_add_validators)(request, response, validators)
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            validators, use_primary = _validators(request, view.__name__, last_modified_func, kwargs)
+            if validators is not None:
+                response = _not_modified(request, validators)
+                if response is not None:
+                    return _add_validators(request, response, validators)
+            with primary_reads() if use_primary else contextlib.nullcontext():
+                response = view(request, *args, **kwargs)
+            return _add_validators(request, response, validators)
+        return wrapper
+    return decorator
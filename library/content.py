@@ -0,0 +1,183 @@
+"""
+Serving of book content files.
+
+The borrow check stays in the views; this module only turns an authorised
+request into a response. It supports conditional GET (ETag/Last-Modified,
+answering 304), single byte ranges (206) so PDF viewers can seek without
+re-downloading, and can hand the transfer to the front-end server with
+X-Sendfile or X-Accel-Redirect (LIBRARY_SENDFILE_BACKEND).
+"""
+import os
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def guess_content_type(file_path):
+    """Content type of a book content file"""
+    content_type = 'application/pdf'
+    if file_path.endswith('.doc') or file_path.endswith('.docx'):
+        content_type = 'application/msword'
+    elif file_path.endswith('.txt'):
+        content_type = 'text/plain'
+    elif file_path.endswith('.epub'):
+        content_type = 'application/epub+zip'
+    return content_type
+
+
+def file_validators(stat):
+    """Strong ETag and Last-Modified timestamp derived from a file's stat result"""
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    return etag, int(stat.st_mtime)
+
+
+def parse_range(header, size):
+    """
+    Parse a single "bytes=start-end" range into an inclusive (start, end).
+
+    Returns None for a missing or unsupported header (served as a full 200) and
+    raises ValueError when the range cannot be satisfied (416).
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if size == 0:
+        # No byte of an empty file can be selected, not even by a suffix range
+        raise ValueError('range of an empty file')
+    if not start:
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError('empty suffix range')
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError('range not satisfiable')
+    return start, end
+
+
+def if_range_matches(request, etag, last_modified):
+    """A Range header only applies if If-Range (when sent) still matches"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def read_range(file_path, start, end):
+    """Yield bytes start..end (inclusive) in bounded chunks"""
+    remaining = end - start + 1
+    with open(file_path, 'rb') as handle:
+        handle.seek(start)
+        while remaining > 0:
+            chunk = handle.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def aread_range(file_path, start, end):
+    """Async version of read_range(), each read runs in a worker thread"""
+    remaining = end - start + 1
+    handle = await sync_to_async(open, thread_sensitive=False)(file_path, 'rb')
+    try:
+        await sync_to_async(handle.seek, thread_sensitive=False)(start)
+        while remaining > 0:
+            chunk = await sync_to_async(handle.read, thread_sensitive=False)(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        handle.close()
+
+
+def sendfile_response(file_field, content_type):
+    """Empty response telling the front-end server which file to send"""
+    backend = getattr(settings, 'LIBRARY_SENDFILE_BACKEND', None)
+    response = HttpResponse(content_type=content_type)
+    if backend == 'x-accel-redirect':
+        # nginx: an `internal` location aliased to MEDIA_ROOT
+        prefix = getattr(settings, 'LIBRARY_SENDFILE_URL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + file_field.name
+    else:
+        # Apache mod_xsendfile / lighttpd
+        response['X-Sendfile'] = file_field.path
+    return response
+
+
+def serve_content_file(request, file_field, disposition, use_async=False):
+    """
+    Return the response for an already authorised content file request.
+
+    With `use_async` the body is an async iterator for the ASGI views, so a
+    slow reader never holds a worker thread between chunks.
+    """
+    file_path = file_field.path
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        raise Http404("File not found")
+
+    content_type = guess_content_type(file_path)
+    etag, last_modified = file_validators(stat)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if getattr(settings, 'LIBRARY_SENDFILE_BACKEND', None):
+            # Ranges are handled by the front-end server in this mode
+            response = sendfile_response(file_field, content_type)
+        else:
+            response = _python_response(
+                request, file_path, stat.st_size, content_type, etag, last_modified, use_async
+            )
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    # Content is only available to borrowers, never store it in shared caches
+    response['Cache-Control'] = 'private, no-cache'
+    if response.status_code in (200, 206):
+        response['Content-Disposition'] = disposition
+    return response
+
+
+def _python_response(request, file_path, size, content_type, etag, last_modified, use_async):
+    byte_range = None
+    if if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        if not use_async:
+            # FileResponse sets Content-Length and uses wsgi.file_wrapper when available
+            return FileResponse(open(file_path, 'rb'), content_type=content_type)
+        response = StreamingHttpResponse(aread_range(file_path, 0, size - 1), content_type=content_type)
+        response['Content-Length'] = str(size)
+        return response
+
+    start, end = byte_range
+    reader = aread_range if use_async else read_range
+    response = StreamingHttpResponse(reader(file_path, start, end), status=206, content_type=content_type)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(end - start + 1)
+    return response
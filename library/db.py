@@ -0,0 +1,207 @@
+"""
+SQLite production tuning, write retries and read-replica routing.
+
+- configure_sqlite applies LIBRARY_SQLITE_PRAGMAS (WAL journaling etc.) to
+  every new SQLite connection.
+- run_atomic() runs a write in a transaction and retries it with backoff when
+  SQLite still reports "database is locked" after its busy timeout, e.g. when
+  two deferred transactions both try to upgrade to a write lock.
+- ReadReplicaRouter sends library model reads made inside views decorated
+  with @use_read_replica to the LIBRARY_READ_REPLICA alias. Auth and session
+  tables always stay on the primary, so a lagging replica never logs anyone
+  out. `manage.py sync_read_replica` refreshes the stand-in replica file.
+
+The replica lags the primary by up to one sync interval, so:
+
+- Until the replica file exists with the same migrations applied as the
+  primary (before the first sync, or after a migration it has not caught up
+  with) reads stay on the primary. This is checked again every
+  LIBRARY_READ_REPLICA_CHECK_SECONDS, a migration can land at any time.
+- PinPrimaryMiddleware gives a client that sent a write (any unsafe method)
+  a cookie that keeps its reads on the primary for
+  LIBRARY_READ_REPLICA_PIN_SECONDS, so it sees its own changes right away.
+- Cached pages and ETag/Last-Modified validators are never built from
+  replica reads that may be behind, see primary_reads() in
+  library/pagecache.py and library/conditional.py.
+"""
+import contextlib
+import contextvars
+import functools
+import os
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError, OperationalError, connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.migrations.recorder import MigrationRecorder
+from django.dispatch import receiver
+
+_use_replica = contextvars.ContextVar('library_use_replica', default=False)
+# Alias -> (whether the replica can serve reads, time.monotonic() of that check)
+_replica_checks = {}
+
+PRIMARY_PIN_COOKIE = 'library_primary'
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'LIBRARY_SQLITE_PRAGMAS', {})
+    if pragmas:
+        with connection.cursor() as cursor:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def is_locked_error(error):
+    return 'database is locked' in str(error) or 'database table is locked' in str(error)
+
+
+def run_atomic(func, *args, using=None, **kwargs):
+    """
+    Call func(*args, **kwargs) in transaction.atomic(), retrying up to
+    LIBRARY_DB_LOCK_RETRIES times when the database is locked.
+
+    func must be safe to run again after a rollback. Inside an outer atomic
+    block the error is re-raised, as only the outermost transaction can retry.
+    """
+    retries = getattr(settings, 'LIBRARY_DB_LOCK_RETRIES', 3)
+    delay = getattr(settings, 'LIBRARY_DB_LOCK_RETRY_DELAY', 0.05)
+    for attempt in range(retries + 1):
+        try:
+            with transaction.atomic(using=using):
+                return func(*args, **kwargs)
+        except OperationalError as error:
+            if (attempt == retries or not is_locked_error(error)
+                    or transaction.get_connection(using).in_atomic_block):
+                raise
+            # Exponential backoff with jitter so the writers don't collide again
+            time.sleep(delay * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def replica_alias():
+    alias = getattr(settings, 'LIBRARY_READ_REPLICA', None)
+    return alias if alias in settings.DATABASES else None
+
+
+def _applied_migrations(alias):
+    return set(MigrationRecorder(connections[alias]).applied_migrations())
+
+
+def _replica_ready(alias):
+    connection = connections[alias]
+    if connection.vendor == 'sqlite' and not os.path.exists(connection.settings_dict['NAME']):
+        # Not synced yet, connecting would only create an empty file
+        return False
+    ready, checked_at = _replica_checks.get(alias, (False, None))
+    max_age = getattr(settings, 'LIBRARY_READ_REPLICA_CHECK_SECONDS', 10)
+    if checked_at is None or time.monotonic() - checked_at >= max_age:
+        try:
+            # Same schema as the primary, columns added by a migration included
+            ready = _applied_migrations(alias) == _applied_migrations('default')
+        except DatabaseError:
+            ready = False
+        _replica_checks[alias] = ready, time.monotonic()
+    return ready
+
+
+def readable_replica_alias():
+    """The replica alias when it can serve library reads, else None (use the primary)"""
+    alias = replica_alias()
+    return alias if alias is not None and _replica_ready(alias) else None
+
+
+def reading_from_replica():
+    """Whether library reads made here would go to the replica"""
+    return _use_replica.get() and readable_replica_alias() is not None
+
+
+@contextlib.contextmanager
+def primary_reads():
+    """Send the library reads inside the block to the primary, even in a @use_read_replica view"""
+    token = _use_replica.set(False)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def pinned_to_primary(request):
+    try:
+        return float(request.COOKIES.get(PRIMARY_PIN_COOKIE, '')) > time.time()
+    except ValueError:
+        return False
+
+
+def use_read_replica(view):
+    """
+    Let the library model reads of a read-only view go to the replica, unless
+    the client wrote something recently (PinPrimaryMiddleware)
+    """
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            token = _use_replica.set(not pinned_to_primary(request))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = _use_replica.set(not pinned_to_primary(request))
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+    return wrapper
+
+
+class PinPrimaryMiddleware:
+    """Keep a client's reads on the primary for a while after each write request"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.pin(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.pin(request, await self.get_response(request))
+
+    def pin(self, request, response):
+        if replica_alias() is not None and request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            seconds = getattr(settings, 'LIBRARY_READ_REPLICA_PIN_SECONDS', 30)
+            response.set_cookie(
+                PRIMARY_PIN_COOKIE, f'{time.time() + seconds:.0f}', max_age=seconds,
+                secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'library' and _use_replica.get():
+            return readable_replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a copy of the primary, schema included
+        return db != replica_alias()
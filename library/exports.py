@@ -0,0 +1,117 @@
+"""
+Streaming CSV/JSONL exports of borrowings and the catalog.
+
+Rows are read with values_list().iterator(chunk_size=...) and encoded one line
+at a time, so an export of any size uses constant memory and the first bytes
+leave the server as soon as the first chunk is fetched. Used by the export
+views and the export_data management command.
+
+Borrower names, titles and descriptions are user input, so CSV cells that a
+spreadsheet would evaluate as a formula are prefixed with an apostrophe.
+"""
+import csv
+import datetime
+import json
+
+from .models import Book, Borrowing
+
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+CHUNK_SIZE = 2000
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+BORROWING_COLUMNS = [
+    ('id', 'id'),
+    ('book_id', 'book_id'),
+    ('book_title', 'book__title'),
+    ('borrower_name', 'borrower_name'),
+    ('borrower_email', 'borrower_email'),
+    ('borrower_phone', 'borrower_phone'),
+    ('borrow_date', 'borrow_date'),
+    ('due_date', 'due_date'),
+    ('return_date', 'return_date'),
+    ('is_returned', 'is_returned'),
+]
+
+CATALOG_COLUMNS = [
+    ('id', 'id'),
+    ('title', 'title'),
+    ('author', 'author__name'),
+    ('isbn', 'isbn'),
+    ('genre', 'genre__name'),
+    ('description', 'description'),
+    ('published_date', 'published_date'),
+    ('total_copies', 'total_copies'),
+    ('available_copies', 'available_copies'),
+    ('status', 'status'),
+]
+
+# Leading characters that make Excel/LibreOffice/Sheets treat a cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def filter_borrowings_by_status(borrowings, status):
+    """The borrowing_list `status` filter: 'active', 'returned' or anything else for all"""
+    if status == 'active':
+        return borrowings.filter(is_returned=False)
+    if status == 'returned':
+        return borrowings.filter(is_returned=True)
+    return borrowings
+
+
+def borrowing_export_rows(status=None, borrower_email=None, using=None):
+    """Borrowings newest first, optionally limited to one borrower"""
+    borrowings = Borrowing.objects.using(using)
+    if borrower_email is not None:
+        borrowings = borrowings.filter(borrower_email=borrower_email)
+    borrowings = filter_borrowings_by_status(borrowings, status).order_by('-borrow_date', '-pk')
+    return _rows(borrowings, BORROWING_COLUMNS)
+
+
+def catalog_export_rows(using=None):
+    return _rows(Book.objects.using(using).order_by('pk'), CATALOG_COLUMNS)
+
+
+def _rows(queryset, columns):
+    # The joins for book__title / author__name happen in the same query
+    return queryset.values_list(*[lookup for _, lookup in columns]).iterator(chunk_size=CHUNK_SIZE)
+
+
+def _json_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def _csv_value(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+class _LineBuffer:
+    """File-like object for csv.writer that hands back each written line"""
+
+    def write(self, value):
+        return value
+
+
+def encode_rows(rows, columns, file_format):
+    """Yield the export one encoded line at a time (CSV starts with a header row)"""
+    names = [name for name, _ in columns]
+    if file_format == 'csv':
+        writer = csv.writer(_LineBuffer())
+        yield writer.writerow(names).encode('utf-8')
+        for row in rows:
+            yield writer.writerow([_csv_value(value) for value in row]).encode('utf-8')
+    else:
+        for row in rows:
+            record = {name: _json_value(value) for name, value in zip(names, row)}
+            yield (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def export_filename(name, file_format):
+    return f'{name}-{datetime.date.today().isoformat()}.{file_format}'
@@ -3,6 +3,7 @@ from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from .models import Book, Author, Genre, Borrowing
 from django.core.exceptions import ValidationError
+from django.db.models import Count
 
 
 class CustomUserCreationForm(UserCreationForm):
@@ -104,6 +105,11 @@ class BorrowingForm(forms.ModelForm):
             'due_date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Book.__str__ renders the author name, join it for the dropdown
+        self.fields['book'].queryset = Book.objects.select_related('author')
+
     def clean_book(self):
         book = self.cleaned_data.get('book')
         if book and book.available_copies == 0:
@@ -111,6 +117,16 @@ class BorrowingForm(forms.ModelForm):
         return book
 
 
+class GenreChoiceField(forms.ModelChoiceField):
+    """Genre dropdown labelled with the number of books in each genre"""
+
+    def label_from_instance(self, obj):
+        book_count = getattr(obj, 'book_count', None)
+        if book_count is None:
+            return obj.name
+        return f'{obj.name} ({book_count})'
+
+
 class SearchForm(forms.Form):
     query = forms.CharField(
         max_length=200,
@@ -118,11 +134,13 @@ class SearchForm(forms.Form):
         widget=forms.TextInput(attrs={
             'class': 'form-control',
             'placeholder': 'Search books, authors, or genres...',
-            'autocomplete': 'off'
+            'autocomplete': 'off',
+            # Filled with suggestions by the script in book_list.html
+            'list': 'query-suggestions',
         })
     )
-    genre = forms.ModelChoiceField(
-        queryset=Genre.objects.all(),
+    genre = GenreChoiceField(
+        queryset=Genre.objects.annotate(book_count=Count('books')).order_by('name'),
         required=False,
         empty_label='All Genres',
         widget=forms.Select(attrs={'class': 'form-control'})
@@ -0,0 +1,57 @@
+"""
+Versions for the cached book template fragments.
+
+book_list.html caches each book card and book_detail.html the detail body
+with {% cache %}, keyed by the book's id, updated_at and fragment version.
+updated_at covers every change to the book row itself, including the
+QuerySet.update() copy counters that send no signals. The version is a random
+token per book kept in the cache; the receivers in library/signals.py delete
+it when a book is saved or deleted, or its author or genre is renamed, and the
+next render draws a new one so the old fragments expire unused.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _version_key(book_id):
+    return f'library:fragments:book:{book_id}'
+
+
+def fragment_timeout():
+    return getattr(settings, 'LIBRARY_FRAGMENT_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def get_book_versions(book_ids):
+    """{book id: version} for `book_ids`, in one cache round trip once they are set"""
+    keys = {_version_key(book_id): book_id for book_id in book_ids}
+    found = cache.get_many(list(keys))
+    versions = {}
+    missing = {}
+    for key, book_id in keys.items():
+        version = found.get(key)
+        if version is None:
+            version = missing[key] = uuid.uuid4().hex[:12]
+        versions[book_id] = version
+    if missing:
+        # No expiry: an evicted token only costs re-rendering that book's fragments
+        cache.set_many(missing, timeout=None)
+    return versions
+
+
+def attach_fragment_versions(books):
+    """Set book.fragment_version on each book of a page or list, for the {% cache %} keys"""
+    books = list(books)
+    versions = get_book_versions([book.pk for book in books])
+    for book in books:
+        book.fragment_version = versions[book.pk]
+    return books
+
+
+def bump_book_versions(book_ids):
+    """Invalidate the fragments of `book_ids` once the current transaction commits"""
+    keys = [_version_key(book_id) for book_id in book_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,145 @@
+"""
+Resized WebP/JPEG variants of book cover images.
+
+Covers are uploaded at any size (some are multi-megabyte screenshots), so
+templates never link the original. Variants are written next to the media
+file under book_covers/variants/ when a book is saved (library/signals.py,
+which also removes them when the cover is replaced or the book deleted) and
+can be backfilled with `manage.py generate_cover_variants`. Rendering never
+resizes anything: the {% cover_picture %} tag links the original until the
+variants exist.
+
+Covers narrower than a variant width are not upscaled, so the widths written
+per cover differ. They are listed in a small JSON manifest written after the
+images, which is also what marks a complete set.
+"""
+import json
+import os
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+
+VARIANT_WIDTHS = (200, 400, 800)
+VARIANT_FORMATS = {
+    # extension: (Pillow format, save options)
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+VARIANT_DIR = 'book_covers/variants'
+WIDTHS_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _stem(image_name):
+    # Keep the original extension in the stem so cover.jpg and cover.png never collide
+    return os.path.basename(image_name).replace('.', '_')
+
+
+def variant_name(image_name, width, extension):
+    """Storage name of one variant, e.g. book_covers/variants/cover_jpg-400w.webp"""
+    return f'{VARIANT_DIR}/{_stem(image_name)}-{width}w.{extension}'
+
+
+def manifest_name(image_name):
+    return f'{VARIANT_DIR}/{_stem(image_name)}.json'
+
+
+def _widths_cache_key(image_name):
+    return f'library:cover-widths:{_stem(image_name)}'
+
+
+def target_widths(original_width):
+    """Variant widths for an original, which itself stands in for the larger ones"""
+    widths = [width for width in VARIANT_WIDTHS if width < original_width]
+    if len(widths) < len(VARIANT_WIDTHS):
+        widths.append(original_width)
+    return widths
+
+
+def variant_widths(image_name):
+    """Widths generated for a cover, None until its variants exist"""
+    key = _widths_cache_key(image_name)
+    widths = cache.get(key)
+    if widths is None:
+        try:
+            with default_storage.open(manifest_name(image_name), 'rb') as handle:
+                widths = json.load(handle)['widths']
+        except (OSError, ValueError, KeyError):
+            # Not generated yet; not cached, so the variants show up once written
+            return None
+        cache.set(key, widths, WIDTHS_CACHE_TIMEOUT)
+    return widths
+
+
+def variants_exist(image_name):
+    return default_storage.exists(manifest_name(image_name))
+
+
+def generate_variants(image_field, force=False):
+    """
+    Write every width/format variant of `image_field`, returns the number written.
+
+    Widths larger than the original are skipped rather than upscaled, one
+    variant at the original width stands in for them.
+    """
+    if not image_field or (not force and variants_exist(image_field.name)):
+        return 0
+
+    with image_field.storage.open(image_field.name, 'rb') as handle:
+        original = Image.open(handle)
+        original = ImageOps.exif_transpose(original)
+        original.load()
+
+    if original.mode not in ('RGB', 'L'):
+        # JPEG has no alpha channel, flatten transparent screenshots onto white
+        background = Image.new('RGB', original.size, (255, 255, 255))
+        rgba = original.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        original = background
+
+    widths = target_widths(original.width)
+    written = 0
+    for extension, (image_format, options) in VARIANT_FORMATS.items():
+        for width in widths:
+            resized = original.copy()
+            if resized.width > width:
+                height = round(resized.height * width / resized.width)
+                resized = resized.resize((width, height), Image.LANCZOS)
+            buffer = BytesIO()
+            resized.save(buffer, image_format, **options)
+            _replace(variant_name(image_field.name, width, extension), buffer.getvalue())
+            written += 1
+
+    # Last, so a listed width is always on disk
+    _replace(manifest_name(image_field.name), json.dumps({'widths': widths}).encode())
+    cache.set(_widths_cache_key(image_field.name), widths, WIDTHS_CACHE_TIMEOUT)
+    return written
+
+
+def _replace(name, content):
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    default_storage.save(name, ContentFile(content))
+
+
+def delete_variants(image_name):
+    """Remove all variants of a cover, e.g. when it is replaced or the book is deleted"""
+    widths = set(VARIANT_WIDTHS) | set(variant_widths(image_name) or ())
+    cache.delete(_widths_cache_key(image_name))
+    names = [manifest_name(image_name)] + [
+        variant_name(image_name, width, extension) for extension in VARIANT_FORMATS for width in widths
+    ]
+    for name in names:
+        if default_storage.exists(name):
+            default_storage.delete(name)
+
+
+def srcset(image_name, extension, widths):
+    """srcset attribute value listing the generated widths of one format"""
+    return ', '.join(
+        f'{default_storage.url(variant_name(image_name, width, extension))} {width}w'
+        for width in widths
+    )
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from library import exports
+
+
+class Command(BaseCommand):
+    help = 'Stream borrowings or the book catalog to a CSV or JSONL file (or stdout)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=['borrowings', 'catalog'])
+        parser.add_argument('--format', choices=exports.EXPORT_FORMATS, default='csv')
+        parser.add_argument(
+            '--status', choices=['active', 'returned'],
+            help='Only active or returned borrowings (like the borrowing list filter)',
+        )
+        parser.add_argument('--email', help='Only borrowings of this borrower email')
+        parser.add_argument('-o', '--output', help='Output file (default: stdout)')
+
+    def handle(self, *args, **options):
+        if options['dataset'] == 'borrowings':
+            rows = exports.borrowing_export_rows(options['status'], options['email'])
+            columns = exports.BORROWING_COLUMNS
+        else:
+            if options['status'] or options['email']:
+                raise CommandError('--status and --email only apply to borrowings')
+            rows = exports.catalog_export_rows()
+            columns = exports.CATALOG_COLUMNS
+
+        lines = exports.encode_rows(rows, columns, options['format'])
+        if not options['output']:
+            # Through self.stdout, so call_command(stdout=...) can capture it
+            for line in lines:
+                self.stdout.write(line.decode('utf-8'), ending='')
+            return
+
+        count = -1 if options['format'] == 'csv' else 0  # not counting the header
+        with open(options['output'], 'wb') as handle:
+            for line in lines:
+                handle.write(line)
+                count += 1
+        self.stderr.write(self.style.SUCCESS(f'Exported {count} row(s) to {options["output"]}'))
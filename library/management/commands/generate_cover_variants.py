@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from library.fragments import bump_book_versions
+from library.images import generate_variants
+from library.models import Book
+from library.pagecache import author_tag, book_tag, purge_pages
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP/JPEG variants for existing book cover images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate variants that already exist')
+
+    def handle(self, *args, **options):
+        covers = Book.objects.exclude(cover_image='').exclude(cover_image__isnull=True)
+        generated = 0
+        failed = 0
+
+        for book in covers.only('title', 'author_id', 'cover_image').iterator():
+            try:
+                written = generate_variants(book.cover_image, force=options['force'])
+            except OSError as error:
+                failed += 1
+                self.stderr.write(f'Skipped "{book.title}": {error}')
+                continue
+            if written:
+                generated += 1
+                self.refresh_pages(book)
+                self.stdout.write(f'Generated {written} variants for "{book.title}"')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'\nGenerated variants for {generated} cover(s), {failed} failed.')
+        )
+
+    def refresh_pages(self, book):
+        """The cached cards, pages and validators still carry the old <img> markup"""
+        Book.objects.filter(pk=book.pk).update(updated_at=timezone.now())
+        bump_book_versions([book.pk])
+        purge_pages('books', book_tag(book.pk), author_tag(book.author_id))
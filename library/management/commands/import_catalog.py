@@ -0,0 +1,248 @@
+import csv
+import json
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from library.models import Author, Book, Borrowing, Genre
+from library.pagecache import purge_all_pages
+from library.search import get_search_backend
+from library.stats import rebuild_stats
+
+
+UPDATE_FIELDS = [
+    'title', 'author', 'genre', 'description', 'published_date',
+    'total_copies', 'available_copies', 'status', 'updated_at',
+]
+
+
+class RowError(ValueError):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk import books from a CSV or JSONL file. Columns/keys: title, author '
+        '(required), isbn, genre, description, published_date (YYYY-MM-DD), '
+        'total_copies, available_copies (new books only, updated books keep the '
+        'copies that are out on loan)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV (with header row) or JSONL file')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per transaction (default: 2000)')
+        parser.add_argument(
+            '--on-conflict', choices=['skip', 'update'], default='skip',
+            help='What to do with rows whose ISBN already exists (default: skip)',
+        )
+        parser.add_argument(
+            '--no-reindex', action='store_true',
+            help='Skip rebuilding the search index and home page stats afterwards',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        self.batch_size = options['batch_size']
+        self.on_conflict = options['on_conflict']
+        if self.batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        # Name -> id maps, so each author/genre is looked up or created only once
+        # (author names are not unique, the oldest author with a name is used)
+        self.authors = {}
+        for name, pk in Author.objects.order_by('pk').values_list('name', 'pk').iterator():
+            self.authors.setdefault(name, pk)
+        self.genres = dict(Genre.objects.values_list('name', 'pk'))
+        self.counts = {'created': 0, 'updated': 0, 'skipped': 0, 'invalid': 0}
+
+        started = time.perf_counter()
+        rows_read = 0
+        batch = []
+        try:
+            with open(path, newline='', encoding='utf-8') as handle:
+                for line_number, row in self.read_rows(handle, file_format):
+                    rows_read += 1
+                    try:
+                        batch.append(self.clean_row(row))
+                    except RowError as error:
+                        self.counts['invalid'] += 1
+                        if self.counts['invalid'] <= 20:
+                            self.stderr.write(f'Line {line_number}: {error}')
+                    if len(batch) >= self.batch_size:
+                        self.import_batch(batch)
+                        batch = []
+                        self.report_progress(rows_read, started)
+                if batch:
+                    self.import_batch(batch)
+        except OSError as error:
+            raise CommandError(f'Cannot read {path}: {error}')
+
+        if not options['no_reindex'] and (self.counts['created'] or self.counts['updated']):
+            # bulk_create/bulk_update bypass the signals that maintain these
+            self.stdout.write('Rebuilding search index and library stats...')
+            get_search_backend().rebuild()
+            rebuild_stats()
+        if self.counts['created'] or self.counts['updated']:
+            # Cached anonymous pages are purged by the same signals
+            purge_all_pages()
+
+        elapsed = time.perf_counter() - started
+        rate = rows_read / elapsed if elapsed else rows_read
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\nImported {rows_read} row(s) in {elapsed:.1f}s ({rate:,.0f} rows/sec): '
+                f'{self.counts["created"]} created, {self.counts["updated"]} updated, '
+                f'{self.counts["skipped"]} skipped, {self.counts["invalid"]} invalid'
+            )
+        )
+
+    def read_rows(self, handle, file_format):
+        """Yield (line number, dict) one row at a time, never loading the whole file"""
+        if file_format == 'csv':
+            reader = csv.DictReader(handle)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for line_number, line in enumerate(handle, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                row = {'__error__': f'invalid JSON ({error})'}
+            yield line_number, row
+
+    def clean_row(self, row):
+        if not isinstance(row, dict):
+            raise RowError('expected an object')
+        if '__error__' in row:
+            raise RowError(row['__error__'])
+
+        title = str(row.get('title') or '').strip()
+        author = str(row.get('author') or '').strip()
+        if not title or not author:
+            raise RowError('title and author are required')
+        if len(title) > 300:
+            raise RowError('title is longer than 300 characters')
+
+        isbn = str(row.get('isbn') or '').strip() or None
+        if isbn and len(isbn) > 13:
+            raise RowError(f'ISBN "{isbn}" is longer than 13 characters')
+
+        published_date = row.get('published_date') or None
+        if published_date and not isinstance(published_date, date):
+            try:
+                published_date = parse_date(str(published_date))
+            except ValueError:
+                published_date = None
+            if published_date is None:
+                raise RowError(f'invalid published_date "{row.get("published_date")}"')
+
+        try:
+            # Missing means one copy, an explicit 0 is invalid rather than 1
+            total = row.get('total_copies')
+            total_copies = 1 if total in (None, '') else int(total)
+            available = row.get('available_copies')
+            available_copies = total_copies if available in (None, '') else int(available)
+        except (TypeError, ValueError):
+            raise RowError('copy counts must be integers')
+        if total_copies < 1 or available_copies < 0:
+            raise RowError('total_copies must be >= 1 and available_copies >= 0')
+        available_copies = min(available_copies, total_copies)
+
+        return {
+            'title': title,
+            'author': author[:200],
+            'genre': str(row.get('genre') or '').strip()[:100] or None,
+            'isbn': isbn,
+            'description': row.get('description') or None,
+            'published_date': published_date,
+            'total_copies': total_copies,
+            'available_copies': available_copies,
+        }
+
+    def resolve_names(self, rows):
+        """Create authors/genres not seen before, in one bulk insert each"""
+        new_authors = {row['author'] for row in rows} - self.authors.keys()
+        if new_authors:
+            Author.objects.bulk_create([Author(name=name) for name in new_authors])
+            # Not every database returns primary keys from bulk_create
+            for name, pk in Author.objects.filter(name__in=new_authors).order_by('pk').values_list('name', 'pk'):
+                self.authors.setdefault(name, pk)
+        new_genres = {row['genre'] for row in rows if row['genre']} - self.genres.keys()
+        if new_genres:
+            Genre.objects.bulk_create([Genre(name=name) for name in new_genres], ignore_conflicts=True)
+            self.genres.update(Genre.objects.filter(name__in=new_genres).values_list('name', 'pk'))
+
+    def build_book(self, row, now, available_copies=None):
+        if available_copies is None:
+            available_copies = row['available_copies']
+        return Book(
+            title=row['title'],
+            author_id=self.authors[row['author']],
+            genre_id=self.genres.get(row['genre']),
+            isbn=row['isbn'],
+            description=row['description'],
+            published_date=row['published_date'],
+            total_copies=row['total_copies'],
+            available_copies=available_copies,
+            # Mirrors Book.save(), which bulk_create does not call
+            status='borrowed' if available_copies == 0 else 'available',
+            created_at=now,
+            updated_at=now,
+        )
+
+    def import_batch(self, rows):
+        by_isbn = {}
+        without_isbn = []
+        for row in rows:
+            if row['isbn']:
+                if row['isbn'] in by_isbn:
+                    # Duplicate within the batch: keep the first row, or let the
+                    # last one update it. Either way the duplicate is counted
+                    # here and the kept row once below.
+                    if self.on_conflict == 'skip':
+                        self.counts['skipped'] += 1
+                        continue
+                    self.counts['updated'] += 1
+                by_isbn[row['isbn']] = row
+            else:
+                without_isbn.append(row)
+
+        now = timezone.now()
+        with transaction.atomic():
+            existing = dict(Book.objects.filter(isbn__in=list(by_isbn)).values_list('isbn', 'pk'))
+            to_create = without_isbn + [row for isbn, row in by_isbn.items() if isbn not in existing]
+            conflicts = [row for isbn, row in by_isbn.items() if isbn in existing]
+            self.resolve_names(to_create + (conflicts if self.on_conflict == 'update' else []))
+
+            Book.objects.bulk_create([self.build_book(row, now) for row in to_create])
+            self.counts['created'] += len(to_create)
+
+            if self.on_conflict == 'update' and conflicts:
+                # Copies out on loan stay out whatever the file says
+                on_loan = dict(
+                    Borrowing.objects.filter(book_id__in=existing.values(), is_returned=False)
+                    .order_by().values('book_id').annotate(count=Count('pk')).values_list('book_id', 'count')
+                )
+                books = []
+                for row in conflicts:
+                    pk = existing[row['isbn']]
+                    book = self.build_book(row, now, max(row['total_copies'] - on_loan.get(pk, 0), 0))
+                    book.pk = pk
+                    books.append(book)
+                Book.objects.bulk_update(books, UPDATE_FIELDS)
+                self.counts['updated'] += len(conflicts)
+            else:
+                self.counts['skipped'] += len(conflicts)
+
+    def report_progress(self, rows_read, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'  {rows_read:,} rows read, {rows_read / elapsed:,.0f} rows/sec')
@@ -0,0 +1,44 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+
+# Source images under the first STATICFILES_DIRS entry and the widths to produce
+STATIC_IMAGES = {
+    'img/background.jpg': (1280, 1920),
+}
+FORMATS = {
+    'jpg': ('JPEG', {'quality': 70, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', {'quality': 70, 'method': 6}),
+}
+
+
+class Command(BaseCommand):
+    help = 'Write resized, recompressed JPEG/WebP variants of large static images (e.g. background-1920.webp)'
+
+    def handle(self, *args, **options):
+        if not settings.STATICFILES_DIRS:
+            raise CommandError('STATICFILES_DIRS is empty')
+        static_dir = Path(settings.STATICFILES_DIRS[0])
+
+        for name, widths in STATIC_IMAGES.items():
+            source = static_dir / name
+            if not source.exists():
+                self.stderr.write(f'Missing {source}, skipped')
+                continue
+            with Image.open(source) as original:
+                original = original.convert('RGB')
+                for width in widths:
+                    height = round(original.height * width / original.width)
+                    resized = original.resize((width, height), Image.LANCZOS)
+                    for extension, (image_format, save_options) in FORMATS.items():
+                        target = source.with_name(f'{source.stem}-{width}.{extension}')
+                        resized.save(target, image_format, **save_options)
+                        self.stdout.write(
+                            f'{target.relative_to(static_dir)}: {target.stat().st_size // 1024} KB '
+                            f'(source {source.stat().st_size // 1024} KB)'
+                        )
+
+        self.stdout.write(self.style.SUCCESS('Static image variants written.'))
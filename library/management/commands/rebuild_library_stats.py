@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from library.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = 'Recount the dashboard statistics shown on the home page'
+
+    def handle(self, *args, **options):
+        stats = rebuild_stats()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Library stats rebuilt: {stats.total_books} books '
+                f'({stats.available_books} available), {stats.total_authors} authors, '
+                f'{stats.total_genres} genres, {stats.borrowed_books} active borrowings'
+            )
+        )
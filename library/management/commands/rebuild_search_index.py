@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from library.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the catalog full-text search index from the Book table'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        indexed = backend.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Search index rebuilt with {backend.__class__.__name__}. '
+                f'Books indexed: {indexed}'
+            )
+        )
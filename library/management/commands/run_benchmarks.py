@@ -0,0 +1,241 @@
+import json
+import logging
+import platform
+import subprocess
+import time
+import tracemalloc
+from urllib.parse import urlencode
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+from library.models import Author, Book, Borrowing, Genre
+from library.performance import percentiles
+
+
+# GET on these changes state
+SKIP_URL_NAMES = {'logout'}
+# Extra query strings benchmarked besides the bare URL
+URL_VARIANTS = {
+    'book_list': [{'query': 'shadow'}, {'query': 'the'}],
+    'borrowing_list': [{'status': 'active'}, {'status': 'returned'}],
+    'book_autocomplete': [{'q': 'sha'}],
+}
+DEFAULT_PARAMS = {
+    'book_autocomplete': {'q': 'a'},
+    'book_content_search': {'q': 'the'},
+}
+
+
+def named_patterns():
+    """(name, pattern) of every named URL in library/urls.py, in order"""
+    for pattern in get_resolver('library.urls').url_patterns:
+        if pattern.name:
+            yield pattern.name, pattern
+
+
+class Command(BaseCommand):
+    help = (
+        'Request every named URL of library/urls.py with the test client as an anonymous, a regular '
+        'and a staff user, and report latency percentiles, query counts and peak '
+        'memory; results can be written as JSON and compared with an earlier run'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per URL and role (default: 20)')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests first (default: 2)')
+        parser.add_argument('--roles', default='anonymous,regular,staff', help='Comma separated roles to run as')
+        parser.add_argument('--only', help='Comma separated URL names to benchmark (default: all)')
+        parser.add_argument('--skip', default='', help='Comma separated URL names to leave out')
+        parser.add_argument('-o', '--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='Earlier JSON results to show p50/query deltas against')
+        parser.add_argument('--label', help='Name of this run in the results (default: current git commit)')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+        objects = self.sample_objects()
+        users = self.role_users(options['roles'].split(','), objects['borrowing'])
+        only = set(filter(None, (options['only'] or '').split(',')))
+        skip = SKIP_URL_NAMES | set(filter(None, options['skip'].split(',')))
+        targets = [
+            (name, url) for name, url in self.urls(objects)
+            if name not in skip and (not only or name in only)
+        ]
+
+        # The test client's host, without setup_test_environment(): its template
+        # instrumentation would add its own overhead to every render
+        allowed_hosts = settings.ALLOWED_HOSTS
+        settings.ALLOWED_HOSTS = list(allowed_hosts) + ['testserver']
+        # 404s/403s are expected for some roles, keep "Not Found: ..." out of the report
+        request_logger = logging.getLogger('django.request')
+        request_log_level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        results = []
+        try:
+            for role, user in users:
+                client = Client()
+                if user:
+                    client.force_login(user)
+                for name, url in targets:
+                    result = self.measure(client, url, options['iterations'], options['warmup'])
+                    result.update(role=role, name=name, url=url)
+                    results.append(result)
+                    self.report(result)
+        finally:
+            settings.ALLOWED_HOSTS = allowed_hosts
+            request_logger.setLevel(request_log_level)
+
+        data = {
+            'label': options['label'] or self.git_commit(),
+            'created': timezone.now().isoformat(),
+            'iterations': options['iterations'],
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'rows': {
+                'books': Book.objects.count(),
+                'authors': Author.objects.count(),
+                'genres': Genre.objects.count(),
+                'borrowings': Borrowing.objects.count(),
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(data, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+        if options['compare']:
+            self.compare(data, options['compare'])
+
+    def sample_objects(self):
+        book = Book.objects.order_by('pk').first()
+        author = Author.objects.annotate(book_count=Count('books')).filter(book_count__gt=0).order_by('pk').first()
+        borrowing = Borrowing.objects.filter(is_returned=False).order_by('pk').first()
+        if not (book and author and borrowing):
+            raise CommandError('Seed the database first (manage.py seed_benchmark_data)')
+        return {'book': book, 'author': author, 'borrowing': borrowing}
+
+    def role_users(self, roles, borrowing):
+        users = []
+        for role in roles:
+            if role == 'anonymous':
+                users.append((role, None))
+            elif role == 'regular':
+                # A reader with active borrowings, so the borrowed-book paths run
+                user = User.objects.filter(is_staff=False, email=borrowing.borrower_email).first()
+                user = user or User.objects.filter(is_staff=False).exclude(email='').first()
+                if user:
+                    users.append((role, user))
+                else:
+                    self.stderr.write('No regular user found, skipping that role')
+            elif role == 'staff':
+                user = User.objects.filter(is_staff=True).first()
+                if user:
+                    users.append((role, user))
+                else:
+                    self.stderr.write('No staff user found, skipping that role')
+            else:
+                raise CommandError(f'Unknown role "{role}"')
+        return users
+
+    def urls(self, objects):
+        """(name, url) for every named URL, filling path arguments with sample objects"""
+        for name, pattern in named_patterns():
+            kwargs = {}
+            for arg in pattern.pattern.converters:
+                if arg == 'number':
+                    kwargs[arg] = 1
+                elif name.startswith('borrowing') and arg == 'pk':
+                    kwargs[arg] = objects['borrowing'].pk
+                elif name.startswith('author'):
+                    kwargs[arg] = objects['author'].pk
+                else:
+                    kwargs[arg] = objects['book'].pk
+            base = reverse(name, kwargs=kwargs)
+            for params in [DEFAULT_PARAMS.get(name, {})] + URL_VARIANTS.get(name, []):
+                query = urlencode(params)
+                yield name, f'{base}?{query}' if query else base
+
+    def request(self, client, url):
+        response = client.get(url)
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+        response.close()
+        return response, size
+
+    def measure(self, client, url, iterations, warmup):
+        for _ in range(warmup):
+            self.request(client, url)
+
+        timings, query_counts = [], []
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response, size = self.request(client, url)
+                timings.append((time.perf_counter() - started) * 1000)
+            query_counts.append(len(queries.captured_queries))
+
+        # Separate pass, tracing allocations slows the request down
+        tracemalloc.start()
+        try:
+            self.request(client, url)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'status': response.status_code,
+            'bytes': size,
+            'latency_ms': percentiles(timings),
+            'queries': percentiles(query_counts),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def report(self, result):
+        latency = result['latency_ms']
+        self.stdout.write(
+            f'{result["role"]:<9} {result["status"]} {result["url"]:<42} '
+            f'p50 {latency["p50"]:>8.2f}ms  p95 {latency["p95"]:>8.2f}ms  '
+            f'{result["queries"]["max"]:>3} queries  {result["peak_memory_kb"]:>9.1f} KiB'
+        )
+
+    def compare(self, data, path):
+        try:
+            with open(path) as handle:
+                previous = json.load(handle)
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Cannot read {path}: {error}')
+        before = {(r['role'], r['url']): r for r in previous.get('results', [])}
+        self.stdout.write(f'\nCompared with {previous.get("label")} ({previous.get("created")}):')
+        for result in data['results']:
+            old = before.get((result['role'], result['url']))
+            if not old:
+                continue
+            old_p50, new_p50 = old['latency_ms']['p50'], result['latency_ms']['p50']
+            change = (new_p50 - old_p50) / old_p50 * 100 if old_p50 else 0
+            queries = result['queries']['max'] - old['queries']['max']
+            self.stdout.write(
+                f'{result["role"]:<9} {result["url"]:<42} p50 {old_p50:>8.2f} -> {new_p50:>8.2f}ms '
+                f'({change:+.0f}%)  queries {queries:+d}'
+            )
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                cwd=settings.BASE_DIR, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return 'unknown'
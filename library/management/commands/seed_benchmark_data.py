@@ -0,0 +1,210 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from library.models import Author, Book, Borrowing, Genre
+from library.pagecache import purge_all_pages
+from library.search import get_search_backend
+from library.stats import rebuild_stats
+
+
+WORDS = (
+    'shadow river garden winter silent empire glass storm letters midnight '
+    'ocean forgotten city secret house light stone journey northern crown '
+    'iron song memory fire island summer paper dark golden last wild road '
+    'history kingdom mountain stars broken wind queen machine hidden moon '
+    'distant voices blood salt orchard harbor lantern atlas quiet war'
+).split()
+FIRST_NAMES = 'Ada Alan Clara David Elena Frank Grace Hugo Iris James Kara Leo Maya Nina Omar Paul Rosa Sam Tara Victor'.split()
+LAST_NAMES = 'Adams Baker Chen Diaz Evans Fischer Garcia Hughes Ito Jones Khan Lopez Moreau Novak Olsen Park Quinn Rossi Silva Weber'.split()
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate synthetic authors, genres, books, users and borrowings with '
+        'bulk inserts, for benchmarking at realistic scale (use a scratch database)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=1000)
+        parser.add_argument('--genres', type=int, default=50)
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--borrowings', type=int, default=50000)
+        parser.add_argument('--users', type=int, default=100, help='Regular users the borrowings are spread over')
+        parser.add_argument(
+            '--active-ratio', type=float, default=0.1,
+            help='Share of borrowings still active, limited by the copies available (default: 0.1)',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert (default: 5000)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, the same seed gives the same data')
+        parser.add_argument('--password', default='bench', help='Password of the generated users (default: bench)')
+
+    def handle(self, *args, **options):
+        for name in ('authors', 'genres', 'books', 'users', 'batch_size'):
+            if options[name] < 1:
+                raise CommandError(f'--{name.replace("_", "-")} must be at least 1')
+        if options['borrowings'] < 0 or not 0 <= options['active_ratio'] <= 1:
+            raise CommandError('--borrowings must not be negative and --active-ratio must be between 0 and 1')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.run_id = timezone.now().strftime('%Y%m%d%H%M%S')
+        self.today = timezone.localdate()
+        started = time.perf_counter()
+
+        genre_ids = self.phase('genres', self.create_genres, options['genres'])
+        author_ids = self.phase('authors', self.create_authors, options['authors'])
+        emails = self.phase('users', self.create_users, options['users'], options['password'])
+
+        # Decide the active borrowings up front so books are inserted with
+        # matching available_copies/status and never need a second pass
+        copies = [self.rng.randint(1, 5) for _ in range(options['books'])]
+        active = [0] * options['books']
+        for _ in range(int(options['borrowings'] * options['active_ratio'])):
+            index = self.rng.randrange(options['books'])
+            if active[index] < copies[index]:
+                active[index] += 1
+
+        book_ids = self.phase('books', self.create_books, author_ids, genre_ids, copies, active)
+        self.phase('borrowings', self.create_borrowings, options['borrowings'], book_ids, active, emails)
+
+        self.stdout.write('Rebuilding search index and library stats...')
+        get_search_backend().rebuild()
+        stats = rebuild_stats()
+        purge_all_pages()
+        self.stdout.write(self.style.SUCCESS(
+            f'Done in {time.perf_counter() - started:.1f}s. Library now has {stats.total_books} books, '
+            f'{stats.total_authors} authors, {stats.total_genres} genres, '
+            f'{stats.borrowed_books} active borrowings. Users: bench_reader_<n> / bench_staff, '
+            f'password "{options["password"]}"'
+        ))
+
+    def phase(self, label, create, *args):
+        started = time.perf_counter()
+        result = create(*args)
+        count = result if isinstance(result, int) else len(result)
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed else count
+        self.stdout.write(f'  {count:,} {label} in {elapsed:.1f}s ({rate:,.0f} rows/sec)')
+        return result
+
+    def bulk_insert(self, model, objects):
+        """Insert an iterable of unsaved objects in batches, one transaction each"""
+        batch = []
+        count = 0
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                count += self._insert_batch(model, batch)
+                batch = []
+        if batch:
+            count += self._insert_batch(model, batch)
+        return count
+
+    def _insert_batch(self, model, batch):
+        with transaction.atomic():
+            model.objects.bulk_create(batch)
+        return len(batch)
+
+    def new_ids(self, model, first_pk):
+        # Not every database returns primary keys from bulk_create
+        return list(model.objects.filter(pk__gt=first_pk).order_by('pk').values_list('pk', flat=True))
+
+    def max_pk(self, model):
+        return model.objects.aggregate(max_pk=Max('pk'))['max_pk'] or 0
+
+    def create_genres(self, count):
+        first_pk = self.max_pk(Genre)
+        self.bulk_insert(Genre, (Genre(name=f'Genre {self.run_id}-{i}') for i in range(count)))
+        return self.new_ids(Genre, first_pk)
+
+    def create_authors(self, count):
+        first_pk = self.max_pk(Author)
+        rng = self.rng
+        self.bulk_insert(Author, (
+            Author(name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}', bio=self.sentence(12))
+            for i in range(count)
+        ))
+        return self.new_ids(Author, first_pk)
+
+    def create_users(self, count, password):
+        # Hashing is deliberately slow, so every generated user shares one hash
+        password_hash = make_password(password)
+        users = [
+            User(username=f'bench_reader_{i}', email=f'bench_reader_{i}@example.com', password=password_hash)
+            for i in range(count)
+        ]
+        users.append(User(username='bench_staff', email='bench_staff@example.com', password=password_hash, is_staff=True))
+        for start in range(0, len(users), self.batch_size):
+            User.objects.bulk_create(users[start:start + self.batch_size], ignore_conflicts=True)
+        return [user.email for user in users[:-1]]
+
+    def create_books(self, author_ids, genre_ids, copies, active):
+        first_pk = self.max_pk(Book)
+        rng = self.rng
+        now = timezone.now()
+
+        def books():
+            for i, (total, borrowed) in enumerate(zip(copies, active)):
+                available = total - borrowed
+                yield Book(
+                    title=self.sentence(rng.randint(2, 5)).title(),
+                    author_id=rng.choice(author_ids),
+                    genre_id=rng.choice(genre_ids) if rng.random() < 0.95 else None,
+                    # 13 digits, unique per run: run-local counter after the current max pk
+                    isbn=f'979{(first_pk + i + 1) % 10 ** 10:010d}',
+                    description=self.sentence(30),
+                    published_date=self.today - timedelta(days=rng.randint(0, 365 * 80)),
+                    total_copies=total,
+                    available_copies=available,
+                    status='borrowed' if available == 0 else 'available',
+                    created_at=now,
+                    updated_at=now,
+                )
+
+        self.bulk_insert(Book, books())
+        return self.new_ids(Book, first_pk)
+
+    def create_borrowings(self, count, book_ids, active, emails):
+        rng = self.rng
+        now = timezone.now()
+
+        def borrowing(book_id, is_returned):
+            email = rng.choice(emails)
+            if is_returned:
+                borrow_date = self.today - timedelta(days=rng.randint(30, 365 * 3))
+            else:
+                # Recent, so some are due soon and some overdue
+                borrow_date = self.today - timedelta(days=rng.randint(0, 30))
+            due_date = borrow_date + timedelta(days=14)
+            return Borrowing(
+                book_id=book_id,
+                borrower_name=email.split('@')[0].replace('_', ' ').title(),
+                borrower_email=email,
+                borrow_date=borrow_date,
+                due_date=due_date,
+                return_date=due_date - timedelta(days=rng.randint(0, 10)) if is_returned else None,
+                is_returned=is_returned,
+                created_at=now,
+                updated_at=now,
+            )
+
+        def borrowings():
+            produced = 0
+            for book_id, borrowed in zip(book_ids, active):
+                for _ in range(min(borrowed, count - produced)):
+                    produced += 1
+                    yield borrowing(book_id, False)
+            for _ in range(count - produced):
+                yield borrowing(rng.choice(book_ids), True)
+
+        return self.bulk_insert(Borrowing, borrowings())
+
+    def sentence(self, words):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(words))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from library.reminders import REMINDER_KINDS, send_reminders
+
+
+class Command(BaseCommand):
+    help = (
+        'Email borrowers whose active borrowings are due soon or overdue. Each '
+        'borrowing is reminded once per kind (again after its due date changes); '
+        'schedule it daily (cron, systemd timer)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind', choices=REMINDER_KINDS, action='append',
+            help='Reminder kind to send, may be repeated (default: all)',
+        )
+        parser.add_argument('--days-ahead', type=int, default=2, help='"Due soon" window in days (default: 2)')
+        parser.add_argument('--batch-size', type=int, default=100, help='Emails per batch (default: 100)')
+        parser.add_argument('--date', help='Treat this date (YYYY-MM-DD) as today')
+        parser.add_argument('--dry-run', action='store_true', help='List the reminders without sending them')
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Forget what previous runs sent and start over from the oldest candidate',
+        )
+
+    def handle(self, *args, **options):
+        kinds = options['kind'] or list(REMINDER_KINDS)
+        today = None
+        if options['date']:
+            try:
+                today = parse_date(options['date'])
+            except ValueError:
+                # Well formed but not a real date, e.g. 2026-02-30
+                raise CommandError(f'--date {options["date"]} is not a valid date')
+            if today is None:
+                raise CommandError('--date must be YYYY-MM-DD')
+        if options['batch_size'] < 1 or options['days_ahead'] < 0:
+            raise CommandError('--batch-size must be at least 1 and --days-ahead not negative')
+
+        for kind in kinds:
+            sent = send_reminders(
+                kind, today=today, days_ahead=options['days_ahead'],
+                batch_size=options['batch_size'], dry_run=options['dry_run'], from_start=options['reset'],
+                progress=self.stdout.write if options['verbosity'] > 1 or options['dry_run'] else None,
+            )
+            verb = 'Would send' if options['dry_run'] else 'Sent'
+            self.stdout.write(self.style.SUCCESS(f'{verb} {sent} {kind.replace("_", " ")} reminder(s)'))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from library.models import Book
+from library.pages import current_pages, is_pdf, split_book_content, splitting_available
+
+
+class Command(BaseCommand):
+    help = (
+        'Split PDF book content into single-page files and index the page text, '
+        'for books whose current content file has not been split yet'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--book', type=int, action='append', help='Only this book id (repeatable)')
+        parser.add_argument('--force', action='store_true', help='Split again books that are already split')
+
+    def handle(self, *args, **options):
+        if not splitting_available():
+            raise CommandError('Splitting PDF content needs the optional pypdf package (pip install pypdf)')
+
+        books = Book.objects.exclude(content_file='').exclude(content_file__isnull=True)
+        if options['book']:
+            books = books.filter(pk__in=options['book'])
+        split = 0
+        failed = 0
+
+        for book in books.only('title', 'content_file').order_by('pk').iterator():
+            if not is_pdf(book.content_file):
+                continue
+            if not options['force'] and current_pages(book).exists():
+                continue
+            started = time.perf_counter()
+            try:
+                count = split_book_content(book)
+            except Exception as error:
+                # Unreadable or broken PDFs (OSError and the pypdf errors)
+                failed += 1
+                self.stderr.write(f'Skipped "{book.title}": {error}')
+                continue
+            split += 1
+            self.stdout.write(f'Split "{book.title}" into {count} page(s) in {time.perf_counter() - started:.1f}s')
+
+        self.stdout.write(self.style.SUCCESS(f'\nSplit {split} book(s), {failed} failed.'))
@@ -0,0 +1,51 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from library.db import replica_alias
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the primary SQLite database into the read replica file with the '
+        'online backup API (a stand-in for real replication such as Litestream)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float,
+            help='Keep running and sync again every INTERVAL seconds',
+        )
+
+    def handle(self, *args, **options):
+        alias = replica_alias()
+        if alias is None:
+            raise CommandError(
+                'No read replica configured, set LIBRARY_DB_PROFILE=production '
+                '(the replica file is created by the first sync)'
+            )
+        primary = connections['default'].settings_dict
+        replica = connections[alias].settings_dict
+        if primary['ENGINE'] != 'django.db.backends.sqlite3' or replica['ENGINE'] != primary['ENGINE']:
+            raise CommandError('sync_read_replica only copies SQLite databases')
+
+        while True:
+            started = time.perf_counter()
+            # Nothing to purge: cached pages and validators never come from the replica
+            self.sync(str(primary['NAME']), str(replica['NAME']))
+            self.stdout.write(f'Replica {replica["NAME"]} synced in {time.perf_counter() - started:.2f}s')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def sync(self, source_path, target_path):
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(target_path, timeout=30)
+        try:
+            # Copies in steps, so writers on the primary are only briefly blocked
+            source.backup(target, pages=1024)
+            target.execute('PRAGMA journal_mode = wal')
+        finally:
+            target.close()
+            source.close()
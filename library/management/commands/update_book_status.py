@@ -1,31 +1,87 @@
-from django.core.management.base import BaseCommand
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
 from library.models import Book
+from library.pagecache import purge_all_pages
+from library.stats import rebuild_stats
+
+
+# Status each book should have, mirroring Book.save()
+STATUS_RULES = [
+    ('borrowed', Q(available_copies=0)),
+    ('available', Q(available_copies__gt=0)),
+]
 
 
 class Command(BaseCommand):
     help = 'Update book statuses based on available copies (only mark as borrowed when no copies available)'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of books updated per UPDATE statement (default: 1000)',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report the books that would change without updating them',
+        )
+
     def handle(self, *args, **options):
-        books = Book.objects.all()
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        verbose = options['verbosity'] >= 2
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        started = time.perf_counter()
         updated_count = 0
-        
-        for book in books:
-            old_status = book.status
-            # Trigger save to update status based on new logic
-            book.save()
-            if old_status != book.status:
-                updated_count += 1
+
+        for status, condition in STATUS_RULES:
+            # Only rows whose stored status is wrong are selected, walked in
+            # primary key order so every batch is an indexed range scan
+            stale = Book.objects.filter(condition).exclude(status=status).order_by('pk')
+            last_pk = 0
+            while True:
+                batch = list(
+                    stale.filter(pk__gt=last_pk).values_list(
+                        'pk', 'title', 'status', 'available_copies', 'total_copies'
+                    )[:batch_size]
+                )
+                if not batch:
+                    break
+                last_pk = batch[-1][0]
+
+                if not dry_run:
+                    with transaction.atomic():
+                        updated_count += Book.objects.filter(
+                            pk__in=[row[0] for row in batch]
+                        ).exclude(status=status).update(status=status, updated_at=timezone.now())
+                else:
+                    updated_count += len(batch)
+
+                if verbose:
+                    for pk, title, old_status, available, total in batch:
+                        self.stdout.write(
+                            f'{"Would update" if dry_run else "Updated"} "{title}": '
+                            f'{old_status} -> {status} ({available}/{total} copies)'
+                        )
                 self.stdout.write(
-                    self.style.SUCCESS(
-                        f'Updated "{book.title}": {old_status} -> {book.status} '
-                        f'({book.available_copies}/{book.total_copies} copies)'
-                    )
+                    f'  {status}: {updated_count} book(s) so far, '
+                    f'{time.perf_counter() - started:.2f}s elapsed'
                 )
-        
-        self.stdout.write(
-            self.style.SUCCESS(
-                f'\nSuccessfully updated {updated_count} book(s). '
-                f'Total books processed: {books.count()}'
-            )
-        )
 
+        if updated_count and not dry_run:
+            # Bulk updates bypass the signals that maintain the home page counters
+            # and purge the cached catalog pages
+            rebuild_stats()
+            purge_all_pages()
+
+        elapsed = time.perf_counter() - started
+        if dry_run:
+            summary = f'\nDry run: {updated_count} book(s) would be updated ({elapsed:.2f}s).'
+        else:
+            summary = f'\nSuccessfully updated {updated_count} book(s) in {elapsed:.2f}s.'
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+
+CREATE_FTS_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS library_book_fts USING fts5(
+    title, author, isbn, description,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3 4'
+)
+"""
+
+POPULATE_FTS_TABLE = """
+INSERT INTO library_book_fts (rowid, title, author, isbn, description)
+SELECT b.id, b.title, a.name, COALESCE(b.isbn, ''), COALESCE(b.description, '')
+FROM library_book b JOIN library_author a ON a.id = b.author_id
+"""
+
+
+def create_search_index(apps, schema_editor):
+    # The full-text index is SQLite specific, other databases use icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_FTS_TABLE)
+    schema_editor.execute(POPULATE_FTS_TABLE)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS library_book_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0002_book_content_file'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
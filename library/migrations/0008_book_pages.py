@@ -0,0 +1,57 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Page text of every book; `book` holds the book id so a search within one
+# book is a single MATCH on both columns
+CREATE_PAGE_FTS_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS library_bookpage_fts USING fts5(
+    book, text,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3 4'
+)
+"""
+
+
+def create_page_index(apps, schema_editor):
+    # The full-text index is SQLite specific, other databases use icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_PAGE_FTS_TABLE)
+
+
+def drop_page_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS library_bookpage_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0007_page_validators'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('file', models.FileField(upload_to='book_content/pages/')),
+                ('text', models.TextField(blank=True)),
+                ('source', models.CharField(max_length=255)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='library.book')),
+            ],
+            options={
+                'ordering': ['book', 'number'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='bookpage',
+            constraint=models.UniqueConstraint(fields=('book', 'number'), name='bookpage_book_number_uniq'),
+        ),
+        migrations.RunPython(create_page_index, drop_page_index),
+    ]
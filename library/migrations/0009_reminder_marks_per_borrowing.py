@@ -0,0 +1,48 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def carry_over_marks(apps, schema_editor):
+    """Record the borrowings the old (due_date, id) high-water marks had covered"""
+    Borrowing = apps.get_model('library', 'Borrowing')
+    LegacyReminderMark = apps.get_model('library', 'LegacyReminderMark')
+    ReminderMark = apps.get_model('library', 'ReminderMark')
+    for legacy in LegacyReminderMark.objects.exclude(due_date=None):
+        covered = Borrowing.objects.filter(is_returned=False).filter(
+            models.Q(due_date__lt=legacy.due_date)
+            | models.Q(due_date=legacy.due_date, id__lte=legacy.borrowing_id)
+        )
+        ReminderMark.objects.bulk_create(
+            [
+                ReminderMark(borrowing_id=pk, kind=legacy.kind, due_date=due_date)
+                for pk, due_date in covered.values_list('pk', 'due_date').iterator()
+            ],
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0008_book_pages'),
+    ]
+
+    operations = [
+        migrations.RenameModel('ReminderMark', 'LegacyReminderMark'),
+        migrations.CreateModel(
+            name='ReminderMark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('due_soon', 'Due soon'), ('overdue', 'Overdue')], max_length=20)),
+                ('due_date', models.DateField()),
+                ('sent_at', models.DateTimeField(auto_now=True)),
+                ('borrowing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminder_marks', to='library.borrowing')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='remindermark',
+            constraint=models.UniqueConstraint(fields=('borrowing', 'kind'), name='remindermark_borrowing_kind_uniq'),
+        ),
+        migrations.RunPython(carry_over_marks, migrations.RunPython.noop),
+        migrations.DeleteModel('LegacyReminderMark'),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
 from django.core.validators import MinValueValidator
 from django.utils import timezone
 
@@ -8,9 +9,14 @@ class Author(models.Model):
     bio = models.TextField(blank=True, null=True)
     birth_date = models.DateField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['name']
+        indexes = [
+            # author_list ordering, pk is the keyset pagination tiebreaker
+            models.Index(fields=['name', 'id'], name='author_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -20,6 +26,7 @@ class Genre(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['name']
@@ -51,6 +58,13 @@ class Book(models.Model):
 
     class Meta:
         ordering = ['title']
+        indexes = [
+            # book_list ordering, unfiltered and per genre, and author_detail
+            models.Index(fields=['title', 'id'], name='book_title_idx'),
+            models.Index(fields=['genre', 'title', 'id'], name='book_genre_title_idx'),
+            models.Index(fields=['author', 'title'], name='book_author_title_idx'),
+            models.Index(fields=['status'], name='book_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} by {self.author.name}"
@@ -65,6 +79,51 @@ class Book(models.Model):
             self.status = 'available'
         super().save(*args, **kwargs)
 
+    def checkout_copy(self):
+        """
+        Take one copy for a borrowing, returns False when none are left.
+
+        A single conditional UPDATE decrements the count and derives the status,
+        so concurrent borrowers can never take more copies than exist.
+        """
+        from .stats import adjust_stats
+
+        with transaction.atomic():
+            taken = Book.objects.filter(pk=self.pk, available_copies__gt=0).update(
+                available_copies=F('available_copies') - 1,
+                status=Case(
+                    When(available_copies__lte=1, then=Value('borrowed')),
+                    default=Value('available'),
+                ),
+                updated_at=timezone.now(),
+            )
+            if not taken:
+                return False
+            self._refresh_copies()
+            # update() bypasses signals, keep the dashboard counters in step
+            if self.available_copies == 0:
+                adjust_stats(available_books=-1)
+        return True
+
+    def release_copy(self):
+        """Give one copy back after a return, in a single UPDATE"""
+        from .stats import adjust_stats
+
+        with transaction.atomic():
+            Book.objects.filter(pk=self.pk).update(
+                available_copies=F('available_copies') + 1,
+                status='available',
+                updated_at=timezone.now(),
+            )
+            self._refresh_copies()
+            if self.available_copies == 1:
+                adjust_stats(available_books=1)
+
+    def _refresh_copies(self):
+        self.refresh_from_db(fields=['available_copies', 'status', 'updated_at'])
+        # Reset the status remembered for incremental stats (see library/signals.py)
+        self._stats_status = self.status
+
 
 class Borrowing(models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='borrowings')
@@ -80,15 +139,112 @@ class Borrowing(models.Model):
 
     class Meta:
         ordering = ['-borrow_date']
+        # SQLite compares booleans as `NOT is_returned`, which a composite index
+        # cannot seek on, so filters on active borrowings use partial indexes
+        indexes = [
+            # Content access checks (covering) and the per-user borrowing_list
+            models.Index(
+                fields=['borrower_email', 'book'], name='borrowing_borrower_active_idx',
+                condition=models.Q(is_returned=False),
+            ),
+            models.Index(fields=['borrower_email', '-borrow_date', '-id'], name='borrowing_borrower_date_idx'),
+            # Current borrowings of a book (book_detail)
+            models.Index(
+                fields=['book', '-borrow_date'], name='borrowing_book_active_idx',
+                condition=models.Q(is_returned=False),
+            ),
+            # Staff borrowing_list, unfiltered and active only
+            models.Index(fields=['-borrow_date', '-id'], name='borrowing_date_idx'),
+            models.Index(
+                fields=['-borrow_date', '-id'], name='borrowing_active_date_idx',
+                condition=models.Q(is_returned=False),
+            ),
+            # Due-soon/overdue scans of send_reminders
+            models.Index(
+                fields=['due_date', 'id'], name='borrowing_active_due_idx',
+                condition=models.Q(is_returned=False),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.book.title} - {self.borrower_name}"
 
     def save(self, *args, **kwargs):
-        if self.is_returned and not self.return_date:
-            self.return_date = timezone.now().date()
-            # Increase available copies when book is returned
-            self.book.available_copies += 1
-            self.book.save()
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if self.is_returned and not self.return_date:
+                self.return_date = timezone.now().date()
+                if self.pk:
+                    # Only the request that flips is_returned gives the copy back
+                    claimed = Borrowing.objects.filter(pk=self.pk, is_returned=False).update(
+                        is_returned=True, return_date=self.return_date
+                    )
+                    if not claimed:
+                        # Already returned concurrently, keep the stored values
+                        self.refresh_from_db()
+                        return
+                # Increase available copies when book is returned
+                self.book.release_copy()
+            super().save(*args, **kwargs)
+
+
+
+class BookPage(models.Model):
+    """
+    One page of a book's PDF content, split out by library/pages.py so a
+    reader can fetch a single page, with its extracted text for searching
+    """
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='pages')
+    number = models.PositiveIntegerField()
+    file = models.FileField(upload_to='book_content/pages/')
+    text = models.TextField(blank=True)
+    # content_file name the page was split from, to spot replaced uploads
+    source = models.CharField(max_length=255)
+
+    class Meta:
+        ordering = ['book', 'number']
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'number'], name='bookpage_book_number_uniq'),
+        ]
 
+    def __str__(self):
+        return f"{self.book_id} p. {self.number}"
+
+
+class ReminderMark(models.Model):
+    """
+    A reminder already sent about a borrowing, and the due date it was about,
+    so each borrowing is reminded once per kind (and again after a renewal)
+    """
+    KIND_CHOICES = [
+        ('due_soon', 'Due soon'),
+        ('overdue', 'Overdue'),
+    ]
+
+    borrowing = models.ForeignKey(Borrowing, on_delete=models.CASCADE, related_name='reminder_marks')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    due_date = models.DateField()
+    sent_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['borrowing', 'kind'], name='remindermark_borrowing_kind_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} reminder for borrowing #{self.borrowing_id} due {self.due_date}"
+
+
+class LibraryStats(models.Model):
+    """Single-row dashboard counters, kept current by library/stats.py"""
+    total_books = models.IntegerField(default=0)
+    total_authors = models.IntegerField(default=0)
+    total_genres = models.IntegerField(default=0)
+    borrowed_books = models.IntegerField(default=0)
+    available_books = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'Library stats'
+
+    def __str__(self):
+        return f"Library stats ({self.updated_at:%Y-%m-%d %H:%M})"
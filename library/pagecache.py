@@ -0,0 +1,180 @@
+"""
+Full-page cache of the public catalog pages for anonymous visitors.
+
+@cache_anonymous_page stores the rendered HTML of a GET for anyone without a
+session or messages cookie; logged-in users, and visitors with a pending flash
+message, always get a fresh render. The key is the scheme, host, path and the
+query string with its parameters sorted, and cached responses carry
+`Vary: Cookie` so shared caches downstream never serve them to a logged-in user.
+
+Instead of a TTL, every entry records the version of the tags it depends on:
+'books', 'authors' and 'genres' for the lists and counts, 'book:<id>' and
+'author:<id>' for the detail pages, and 'all'. The receivers in
+library/signals.py delete the versions of the tags a committed Book, Author,
+Genre or Borrowing change touches, and an entry whose versions no longer
+match is rendered again. Bulk commands that bypass the signals call
+purge_all_pages(). The entry timeout only bounds memory.
+
+Misses are rendered from the primary even in @use_read_replica views: a
+replica that has not caught up with a purged change would otherwise put the
+old page back under the new versions, with nothing left to purge it.
+"""
+import functools
+import hashlib
+import uuid
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import urlencode
+
+from .db import primary_reads
+
+ALL_PAGES = 'all'
+
+
+def book_tag(pk):
+    return f'book:{pk}'
+
+
+def author_tag(pk):
+    return f'author:{pk}'
+
+
+def _tag_key(tag):
+    return f'library:page-tag:{tag}'
+
+
+def _page_key(request):
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    url = f'{request.scheme}://{request.get_host()}{request.path}?{query}'
+    return f'library:page:{hashlib.md5(url.encode()).hexdigest()}'
+
+
+def page_cache_timeout():
+    return getattr(settings, 'LIBRARY_PAGE_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def is_cacheable_request(request):
+    """Anonymous GET/HEAD with nothing per-visitor to render"""
+    return (
+        page_cache_timeout() > 0
+        and request.method in ('GET', 'HEAD')
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and CookieStorage.cookie_name not in request.COOKIES
+    )
+
+
+def is_cacheable_response(request, response):
+    return (
+        request.method == 'GET'
+        and response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        # A template that used {% csrf_token %} is about to get a cookie set
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+        and 'private' not in response.get('Cache-Control', '')
+    )
+
+
+def _lookup(found, keys):
+    """(cached response or None, tag versions to store with a new entry, missing versions)"""
+    page_key, tag_keys = keys
+    versions, missing = {}, {}
+    for key in tag_keys:
+        version = found.get(key)
+        if version is None:
+            version = missing[key] = uuid.uuid4().hex[:12]
+        versions[key] = version
+    entry = found.get(page_key)
+    if entry is not None and not missing and entry['versions'] == versions:
+        return _from_entry(entry), versions, missing
+    return None, versions, missing
+
+
+def _from_entry(entry):
+    response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    patch_vary_headers(response, ['Cookie'])
+    response['X-Page-Cache'] = 'hit'
+    return response
+
+
+def _to_entry(response, versions):
+    return {
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        'versions': versions,
+    }
+
+
+def _keys(request, tags, args, kwargs):
+    tags = tags(*args, **kwargs) if callable(tags) else tags
+    return _page_key(request), [_tag_key(tag) for tag in (ALL_PAGES, *tags)]
+
+
+def cache_anonymous_page(tags):
+    """
+    Cache a public view for anonymous visitors until one of `tags` is purged.
+
+    `tags` is a list, or a callable taking the view's URL kwargs that returns one.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if not is_cacheable_request(request):
+                    return await view(request, *args, **kwargs)
+                keys = _keys(request, tags, args, kwargs)
+                found = await cache.aget_many([keys[0], *keys[1]])
+                cached, versions, missing = _lookup(found, keys)
+                if cached is not None:
+                    return cached
+                if missing:
+                    await cache.aset_many(missing, timeout=None)
+                with primary_reads():
+                    response = await view(request, *args, **kwargs)
+                if is_cacheable_response(request, response):
+                    await cache.aset(keys[0], _to_entry(response, versions), page_cache_timeout())
+                    patch_vary_headers(response, ['Cookie'])
+                    response['X-Page-Cache'] = 'miss'
+                return response
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not is_cacheable_request(request):
+                return view(request, *args, **kwargs)
+            keys = _keys(request, tags, args, kwargs)
+            found = cache.get_many([keys[0], *keys[1]])
+            cached, versions, missing = _lookup(found, keys)
+            if cached is not None:
+                return cached
+            if missing:
+                # No expiry: an evicted version only costs re-rendering its pages
+                cache.set_many(missing, timeout=None)
+            # Versions are read before rendering, so a change committed while
+            # the view runs leaves this entry already stale
+            with primary_reads():
+                response = view(request, *args, **kwargs)
+            if is_cacheable_response(request, response):
+                cache.set(keys[0], _to_entry(response, versions), page_cache_timeout())
+                patch_vary_headers(response, ['Cookie'])
+                response['X-Page-Cache'] = 'miss'
+            return response
+        return wrapper
+    return decorator
+
+
+def purge_pages(*tags):
+    """Expire the cached pages depending on any of `tags` once the transaction commits"""
+    keys = [_tag_key(tag) for tag in set(tags)]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def purge_all_pages():
+    purge_pages(ALL_PAGES)
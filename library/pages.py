@@ -0,0 +1,214 @@
+"""
+Per-page assets and page-level text search of PDF book content.
+
+A content PDF is split into one single-page PDF per page (BookPage, stored
+under book_content/pages/<book id>/) so a reader asking for page 40 is sent
+that page with the fonts and images it uses instead of the whole file, and
+the text of every page goes into a page-level full-text index for searching
+within a book.
+
+Splitting a long book takes a while (about a minute for 450 pages), so when
+a book is saved with a new content file it runs in a background thread after
+the transaction commits (LIBRARY_SPLIT_CONTENT_ON_SAVE), and can be run or
+caught up with `manage.py split_book_content`. It needs the optional `pypdf`
+package; without it books are only served whole and the page view falls
+back to the full PDF opened at the requested page.
+
+The page files are written first and the old pages are swapped for the new
+ones in a single transaction, so readers see the old or the new pages but
+never none. The transaction starts with a conditional UPDATE of the book row
+that only matches while the content file is still the one that was split:
+it re-checks the content and takes the write lock in one statement (the
+row lock elsewhere, the database write lock on SQLite, where a concurrent
+split waits or retries on "database is locked"), so concurrent splits of one
+book take turns instead of colliding on the (book, number) constraint.
+"""
+import logging
+import os
+import re
+import threading
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, connections, transaction
+from django.urls import reverse
+
+from .db import run_atomic
+from .models import Book, BookPage
+from .search import build_match_expression
+
+try:
+    import pypdf
+except ImportError:  # optional, content is then only served as the whole file
+    pypdf = None
+
+logger = logging.getLogger(__name__)
+
+PAGE_FTS_TABLE = 'library_bookpage_fts'
+SNIPPET_WORDS = 12
+
+
+def splitting_available():
+    return pypdf is not None
+
+
+def is_pdf(file_field):
+    return bool(file_field) and file_field.name.lower().endswith('.pdf')
+
+
+def whole_file_page_url(book, number):
+    """The full content opened at `number` (PDF open parameters), for unsplit books"""
+    return f"{reverse('book_content_view', args=[book.pk])}#page={number}"
+
+
+def current_pages(book):
+    """Pages split from the book's current content file"""
+    return BookPage.objects.filter(book=book, source=book.content_file.name)
+
+
+def _fts_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def _page_text(pdf_page):
+    try:
+        text = pdf_page.extract_text() or ''
+    except pypdf.errors.PyPdfError:
+        # Unreadable text (broken fonts etc.) must not lose the page itself
+        return ''
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def split_book_content(book):
+    """
+    Replace the pages of `book` with a fresh split of its content file.
+
+    Returns the number of pages, 0 when the content is not a PDF, pypdf is
+    not installed or the content file was replaced while splitting. Raises
+    OSError or pypdf errors for unreadable files.
+    """
+    if pypdf is None or not is_pdf(book.content_file):
+        run_atomic(remove_book_pages, book.pk)
+        return 0
+
+    source = book.content_file.name
+    stem = os.path.splitext(os.path.basename(source))[0]
+    reader = pypdf.PdfReader(book.content_file.path)
+    pages = []
+    try:
+        for number, pdf_page in enumerate(reader.pages, start=1):
+            writer = pypdf.PdfWriter()
+            writer.add_page(pdf_page)
+            buffer = BytesIO()
+            writer.write(buffer)
+            page = BookPage(book=book, number=number, text=_page_text(pdf_page), source=source)
+            page.file.save(f'{book.pk}/{stem}-{number}.pdf', ContentFile(buffer.getvalue()), save=False)
+            pages.append(page)
+        replaced = run_atomic(_replace_pages, book.pk, source, pages)
+    except Exception:
+        _delete_files(pages)
+        raise
+    if not replaced:
+        _delete_files(pages)
+        return 0
+    return len(pages)
+
+
+def _replace_pages(book_id, source, pages):
+    """Swap in the new pages unless the book's content changed meanwhile, safe to retry"""
+    # Claim: a write, so the rest of the transaction runs under the write lock
+    if not Book.objects.filter(pk=book_id, content_file=source).update(content_file=source):
+        # Replaced or removed while splitting, that change has its own split
+        return False
+    remove_book_pages(book_id)
+    for page in pages:
+        # Ids from a rolled back attempt
+        page.pk = None
+    BookPage.objects.bulk_create(pages, batch_size=500)
+    if _fts_enabled():
+        with connection.cursor() as cursor:
+            # The book id is indexed as a token, see search_pages()
+            cursor.execute(
+                f'INSERT INTO {PAGE_FTS_TABLE} (rowid, book, text) '
+                f'SELECT id, book_id, text FROM library_bookpage WHERE book_id = %s',
+                [book_id],
+            )
+    return True
+
+
+def _delete_files(pages):
+    for page in pages:
+        default_storage.delete(page.file.name)
+
+
+def remove_book_pages(book_id):
+    """Delete the pages of a book, their index rows and (after commit) their files"""
+    names = list(BookPage.objects.filter(book_id=book_id).values_list('file', flat=True))
+    if not names:
+        return
+    if _fts_enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {PAGE_FTS_TABLE} WHERE rowid IN '
+                f'(SELECT id FROM library_bookpage WHERE book_id = %s)',
+                [book_id],
+            )
+    BookPage.objects.filter(book_id=book_id).delete()
+    transaction.on_commit(lambda: [default_storage.delete(name) for name in names])
+
+
+def split_book_content_in_background(book_id):
+    """Thread target of the save hook, errors are logged instead of raised"""
+    try:
+        book = Book.objects.filter(pk=book_id).only('content_file').first()
+        if book is not None:
+            count = split_book_content(book)
+            logger.info('Split the content of book %s into %d page(s)', book_id, count)
+    except Exception:
+        logger.warning('Could not split the content of book %s into pages', book_id, exc_info=True)
+    finally:
+        # The thread's own connections, nothing else closes them
+        connections.close_all()
+
+
+def schedule_split(book):
+    """Split a newly uploaded content file in a thread once the saving transaction commits"""
+    if not getattr(settings, 'LIBRARY_SPLIT_CONTENT_ON_SAVE', True):
+        return
+    if pypdf is None:
+        logger.debug('pypdf is not installed, book %s is served whole', book.pk)
+        return
+    thread = threading.Thread(
+        target=split_book_content_in_background, args=(book.pk,),
+        name=f'split-book-content-{book.pk}', daemon=True,
+    )
+    transaction.on_commit(thread.start)
+
+
+def search_pages(book, query, limit=20):
+    """[(page number, text snippet)] of the pages of `book` matching `query`, best first"""
+    if not _fts_enabled():
+        return _search_pages_icontains(book, query, limit)
+    match = build_match_expression(query)
+    if not match:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT p.number, snippet({PAGE_FTS_TABLE}, 1, \'\', \'\', \'…\', {SNIPPET_WORDS}) '
+            f'FROM {PAGE_FTS_TABLE} JOIN library_bookpage p ON p.id = {PAGE_FTS_TABLE}.rowid '
+            f'WHERE {PAGE_FTS_TABLE} MATCH %s AND p.source = %s '
+            f'ORDER BY {PAGE_FTS_TABLE}.rank LIMIT %s',
+            [f'book : "{book.pk}" AND text : ({match})', book.content_file.name, limit],
+        )
+        return cursor.fetchall()
+
+
+def _search_pages_icontains(book, query, limit):
+    results = []
+    for number, text in current_pages(book).filter(text__icontains=query).values_list('number', 'text')[:limit]:
+        start = text.lower().find(query.lower())
+        snippet = text[max(start - 60, 0):start + len(query) + 60]
+        results.append((number, f'…{snippet}…'))
+    return results
@@ -0,0 +1,245 @@
+"""
+Keyset (cursor) pagination for the list views.
+
+Paginator counts every row and skips rows with OFFSET, so deep pages get
+slower the further you go. CursorPaginator instead remembers the ordering key
+of the first/last row on the page in an opaque signed token and filters with
+WHERE (key) > (last key) ... LIMIT n, which costs the same on every page.
+
+A cursor can outlive its rows (deleted or filtered out since, or a bookmark
+taken from a different list) and then selects an empty page; paginate()
+raises StaleCursor for that so the view redirects to the first page instead
+of rendering an empty list.
+"""
+import datetime
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+
+CURSOR_SALT = 'library.pagination.cursor'
+COUNT_CACHE_TIMEOUT = 300
+
+
+class StaleCursor(Exception):
+    """The cursor selected an empty page, `url` is the first page of the same list"""
+
+    def __init__(self, url):
+        super().__init__(url)
+        self.url = url
+
+
+class CursorPage:
+    """One page of results, with the same iteration interface as Paginator pages"""
+    is_cursor = True
+
+    def __init__(self, object_list, has_next, has_previous, paginator, params, approximate_count=None):
+        self.object_list = object_list
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+        self.paginator = paginator
+        self.params = params
+        self.approximate_count = approximate_count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    def has_other_pages(self):
+        return self.has_next_page or self.has_previous_page
+
+    def _url(self, direction, obj=None):
+        params = self.params.copy()
+        params.pop('page', None)
+        params.pop('cursor', None)
+        if direction != 'first':
+            key = self.paginator.key_for(obj) if obj is not None else None
+            params['cursor'] = self.paginator.encode_cursor(direction, key)
+        query = params.urlencode()
+        return f'?{query}' if query else '?'
+
+    @property
+    def first_url(self):
+        return self._url('first')
+
+    @property
+    def previous_url(self):
+        return self._url('prev', self.object_list[0])
+
+    @property
+    def next_url(self):
+        return self._url('next', self.object_list[-1])
+
+    @property
+    def last_url(self):
+        return self._url('last')
+
+
+class CursorPaginator:
+    """
+    Paginate `queryset` by `ordering`, e.g. ('-borrow_date', '-pk').
+
+    The ordering must be unique (end it with pk) and its fields non-null.
+    """
+
+    def __init__(self, queryset, ordering, per_page, approximate_count=False):
+        self.queryset = queryset.order_by(*ordering)
+        self.ordering = ordering
+        self.per_page = per_page
+        self.approximate_count = approximate_count
+
+    def key_for(self, obj):
+        key = []
+        for field in self.ordering:
+            value = getattr(obj, field.lstrip('-'))
+            if isinstance(value, (datetime.date, datetime.datetime)):
+                value = value.isoformat()
+            key.append(value)
+        return key
+
+    def encode_cursor(self, direction, key=None):
+        return signing.dumps({'d': direction, 'k': key}, salt=CURSOR_SALT, compress=True)
+
+    def decode_cursor(self, cursor):
+        """Return (direction, key), an invalid or missing cursor means the first page"""
+        if not cursor:
+            return 'first', None
+        try:
+            data = signing.loads(cursor, salt=CURSOR_SALT)
+            direction, key = data['d'], data['k']
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            return 'first', None
+        if direction not in ('next', 'prev', 'last'):
+            return 'first', None
+        if direction != 'last' and (not isinstance(key, list) or len(key) != len(self.ordering)):
+            return 'first', None
+        return direction, key
+
+    def _seek(self, key, forward):
+        """
+        Build (f1 > v1) OR (f1 = v1 AND f2 > v2) OR ... for the ordering,
+        flipping the comparison for descending fields and for backward seeks.
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, key):
+            name = field.lstrip('-')
+            ascending = not field.startswith('-')
+            lookup = 'gt' if ascending == forward else 'lt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def _reversed_ordering(self):
+        return [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+
+    def _count(self):
+        # Exact COUNT(*) cached for a few minutes, good enough for "about N results"
+        sql_hash = hashlib.md5(str(self.queryset.query).encode()).hexdigest()
+        cache_key = f'library:pagination-count:{sql_hash}'
+        count = cache.get(cache_key)
+        if count is None:
+            count = self.queryset.count()
+            cache.set(cache_key, count, COUNT_CACHE_TIMEOUT)
+        return count
+
+    def _page_queryset(self, cursor):
+        """Return (direction, queryset fetching one row more than a page)"""
+        direction, key = self.decode_cursor(cursor)
+        if direction in ('first', 'next'):
+            queryset = self.queryset
+            if direction == 'next':
+                queryset = queryset.filter(self._seek(key, forward=True))
+        else:
+            # Walk backwards from the cursor (or the end), rows are flipped back later
+            queryset = self.queryset.order_by(*self._reversed_ordering())
+            if direction == 'prev':
+                queryset = queryset.filter(self._seek(key, forward=False))
+        return direction, queryset[:self.per_page + 1]
+
+    def _build_page(self, direction, rows, params, approximate_count):
+        size = self.per_page
+        if direction in ('first', 'next'):
+            has_next = len(rows) > size
+            rows = rows[:size]
+            has_previous = direction == 'next'
+        else:
+            has_previous = len(rows) > size
+            rows = rows[:size][::-1]
+            has_next = direction == 'prev'
+        return CursorPage(rows, has_next, has_previous, self, params, approximate_count)
+
+    def get_page(self, cursor, params):
+        direction, queryset = self._page_queryset(cursor)
+        rows = list(queryset)
+        approximate_count = self._count() if self.approximate_count else None
+        return self._build_page(direction, rows, params, approximate_count)
+
+    async def aget_page(self, cursor, params):
+        """Async version of get_page() for the ASGI views"""
+        direction, queryset = self._page_queryset(cursor)
+        rows = [row async for row in queryset]
+        approximate_count = await sync_to_async(self._count)() if self.approximate_count else None
+        return self._build_page(direction, rows, params, approximate_count)
+
+
+def _use_cursor(ordering):
+    return ordering and getattr(settings, 'LIBRARY_CURSOR_PAGINATION', True)
+
+
+def _cursor_paginator(queryset, per_page, ordering):
+    return CursorPaginator(
+        queryset, ordering, per_page,
+        approximate_count=getattr(settings, 'LIBRARY_PAGINATION_APPROXIMATE_COUNT', False),
+    )
+
+
+def _check_cursor_page(request, page):
+    # Without a cursor the list is just empty, so this never redirects twice
+    if not page and request.GET.get('cursor'):
+        raise StaleCursor(f"{request.path}{page.first_url.rstrip('?')}")
+    return page
+
+
+def paginate(request, queryset, per_page, ordering=None):
+    """
+    Return the page object for a list view.
+
+    Uses keyset pagination when an ordering is given and LIBRARY_CURSOR_PAGINATION
+    is on, otherwise the classic numbered Paginator. Raises StaleCursor when the
+    cursor in the request selects no rows.
+    """
+    if _use_cursor(ordering):
+        paginator = _cursor_paginator(queryset, per_page, ordering)
+        return _check_cursor_page(request, paginator.get_page(request.GET.get('cursor'), request.GET))
+    return Paginator(queryset, per_page).get_page(request.GET.get('page'))
+
+
+async def apaginate(request, queryset, per_page, ordering=None):
+    """Async version of paginate(), the returned page is fully loaded"""
+    if _use_cursor(ordering):
+        paginator = _cursor_paginator(queryset, per_page, ordering)
+        return _check_cursor_page(request, await paginator.aget_page(request.GET.get('cursor'), request.GET))
+
+    def numbered_page():
+        page = Paginator(queryset, per_page).get_page(request.GET.get('page'))
+        page.object_list = list(page.object_list)
+        return page
+
+    return await sync_to_async(numbered_page)()
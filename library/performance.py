@@ -0,0 +1,215 @@
+"""
+Per-request performance instrumentation.
+
+PerformanceMiddleware times each request and collects, through a database
+execute wrapper and the timed template backend below, how many queries ran,
+how long they took and how long the top-level template render took. The
+numbers go out in a Server-Timing header (visible in the browser dev tools),
+requests slower than LIBRARY_SLOW_REQUEST_MS are logged with their slowest
+queries, and recent samples are aggregated per view for the staff-only
+performance_stats endpoint.
+
+Samples are kept in memory per process, so each worker reports only the
+requests it served.
+"""
+import collections
+import contextvars
+import logging
+import math
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('library_request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []  # (seconds, sql)
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+    def add_query(self, duration, sql):
+        self.queries.append((duration, sql))
+        self.db_time += duration
+
+    def slowest_queries(self, count=5):
+        return sorted(self.queries, key=lambda query: query[0], reverse=True)[:count]
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper adding each query to the current request's metrics"""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(time.perf_counter() - start, sql)
+
+
+def install_query_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def _connection_created(sender, connection, **kwargs):
+    # Connections opened in other threads (e.g. sync_to_async under ASGI) too
+    install_query_recorder(connection)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing top-level renders for the middleware.
+    Lazy querysets evaluated while rendering count towards both tpl and db.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class ViewStats:
+    """Bounded recent samples of (total ms, db ms, template ms, queries) per view"""
+
+    def __init__(self, max_samples):
+        self._lock = threading.Lock()
+        self._samples = collections.defaultdict(lambda: collections.deque(maxlen=max_samples))
+        self._counts = collections.Counter()
+
+    def add(self, view_name, total_ms, db_ms, template_ms, query_count):
+        with self._lock:
+            self._samples[view_name].append((total_ms, db_ms, template_ms, query_count))
+            self._counts[view_name] += 1
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+
+    def summary(self):
+        """{view: {'requests', 'samples', 'total_ms': {p50, p90, p95, p99, max}, ...}}"""
+        with self._lock:
+            samples = {view: list(values) for view, values in self._samples.items()}
+            counts = dict(self._counts)
+        summary = {}
+        for view, values in sorted(samples.items()):
+            columns = list(zip(*values))
+            summary[view] = {
+                'requests': counts[view],
+                'samples': len(values),
+                'total_ms': percentiles(columns[0]),
+                'db_ms': percentiles(columns[1]),
+                'template_ms': percentiles(columns[2]),
+                'queries': percentiles(columns[3]),
+            }
+        return summary
+
+
+def percentiles(values):
+    ordered = sorted(values)
+    result = {}
+    for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p95', 0.95), ('p99', 0.99)):
+        # Nearest-rank percentile
+        index = max(math.ceil(fraction * len(ordered)) - 1, 0)
+        result[name] = round(ordered[index], 2)
+    result['max'] = round(ordered[-1], 2)
+    return result
+
+
+view_stats = ViewStats(getattr(settings, 'LIBRARY_PERFORMANCE_SAMPLES', 1000))
+
+
+class PerformanceMiddleware:
+    """Put it first in MIDDLEWARE so the total covers the other middleware"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, 'LIBRARY_SLOW_REQUEST_MS', 500)
+        self.server_timing = getattr(settings, 'LIBRARY_SERVER_TIMING', True)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, metrics)
+        return response
+
+    async def __acall__(self, request):
+        metrics, token = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, metrics)
+        return response
+
+    def start(self):
+        # Connections of this thread that were opened before this module was loaded
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+        metrics = RequestMetrics()
+        return metrics, _current.set(metrics)
+
+    def finish(self, request, response, metrics):
+        total_ms = (time.perf_counter() - metrics.started) * 1000
+        db_ms = metrics.db_time * 1000
+        template_ms = metrics.template_time * 1000
+        query_count = len(metrics.queries)
+
+        if self.server_timing:
+            response['Server-Timing'] = (
+                f'db;dur={db_ms:.1f};desc="{query_count} queries", '
+                f'tpl;dur={template_ms:.1f}, total;dur={total_ms:.1f}'
+            )
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else 'unresolved'
+        view_stats.add(view_name, total_ms, db_ms, template_ms, query_count)
+
+        if self.slow_ms is not None and total_ms >= self.slow_ms:
+            top = ''.join(
+                f'\n  {duration * 1000:.1f}ms {sql[:500]}' for duration, sql in metrics.slowest_queries()
+            )
+            logger.warning(
+                'Slow request %s %s (%s): %.0fms total, %.0fms in %d queries, %.0fms rendering%s',
+                request.method, request.get_full_path(), view_name,
+                total_ms, db_ms, query_count, template_ms, top,
+            )
@@ -0,0 +1,113 @@
+"""
+Due-soon and overdue reminders for active borrowings.
+
+Candidates are the active borrowings due within the window (or overdue)
+without a ReminderMark of that kind for their current due date, read in
+(due_date, id) order from the borrowing_active_due_idx partial index. Every
+batch sent records its marks, so a borrowing created or renewed after a run
+is still reminded by the next one, and a failed run resumes where it
+stopped. Emails go out in batches over one email backend connection.
+"""
+import datetime
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import Borrowing, ReminderMark
+
+
+REMINDER_KINDS = ('due_soon', 'overdue')
+
+
+def candidates(kind, today, days_ahead, after=None, include_reminded=False):
+    """
+    Active borrowings due within `days_ahead` days / overdue that were not
+    reminded about yet, after the (due_date, id) `after` of the current run
+    """
+    borrowings = Borrowing.objects.filter(is_returned=False)
+    if kind == 'due_soon':
+        borrowings = borrowings.filter(due_date__gte=today, due_date__lte=today + datetime.timedelta(days=days_ahead))
+    else:
+        borrowings = borrowings.filter(due_date__lt=today)
+    if not include_reminded:
+        # Marked for an earlier due date (before a renewal) means reminding again
+        borrowings = borrowings.exclude(Exists(ReminderMark.objects.filter(
+            borrowing=OuterRef('pk'), kind=kind, due_date=OuterRef('due_date'),
+        )))
+    if after:
+        # (due_date, id) > after, with a plain lower bound for the index seek
+        due_date, pk = after
+        borrowings = borrowings.filter(due_date__gte=due_date).filter(Q(due_date__gt=due_date) | Q(id__gt=pk))
+    return borrowings.select_related('book').only(
+        'book__title', 'borrower_name', 'borrower_email', 'borrow_date', 'due_date',
+    ).order_by('due_date', 'id')
+
+
+def mark_reminded(kind, borrowings):
+    ReminderMark.objects.bulk_create(
+        [ReminderMark(borrowing=borrowing, kind=kind, due_date=borrowing.due_date) for borrowing in borrowings],
+        update_conflicts=True, unique_fields=['borrowing', 'kind'], update_fields=['due_date', 'sent_at'],
+    )
+
+
+def reminder_message(borrowing, kind, today, connection):
+    title = borrowing.book.title
+    if kind == 'due_soon':
+        subject = f'Reminder: "{title}" is due on {borrowing.due_date:%b %d, %Y}'
+        lead = f'"{title}", which you borrowed on {borrowing.borrow_date:%b %d, %Y}, is due back soon.'
+    else:
+        days = (today - borrowing.due_date).days
+        subject = f'Overdue: "{title}" was due on {borrowing.due_date:%b %d, %Y}'
+        lead = f'"{title}" was due back {days} day(s) ago. Please return it as soon as possible.'
+    body = f'Hello {borrowing.borrower_name},\n\n{lead}\n\nDue date: {borrowing.due_date:%b %d, %Y}\n'
+    return EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [borrowing.borrower_email], connection=connection)
+
+
+def send_reminders(kind, today=None, days_ahead=2, batch_size=100, dry_run=False, from_start=False, progress=None):
+    """
+    Send the reminders of one kind and mark the borrowings; returns the number sent.
+
+    Marks are saved after every batch, so a failed run resumes after the
+    last batch that went out. With `dry_run` nothing is sent or saved.
+    `from_start` forgets the marks, reminding about every current candidate again.
+    """
+    if kind not in REMINDER_KINDS:
+        raise ValueError(f'Unknown reminder kind {kind!r}')
+    today = today or timezone.localdate()
+    if not dry_run:
+        marks = ReminderMark.objects.filter(kind=kind)
+        # Returned borrowings are never candidates again
+        (marks if from_start else marks.filter(borrowing__is_returned=True)).delete()
+
+    connection = None if dry_run else get_connection()
+    sent = 0
+    after = None
+    try:
+        if connection:
+            connection.open()
+        while True:
+            batch = list(candidates(
+                kind, today, days_ahead, after, include_reminded=dry_run and from_start,
+            )[:batch_size])
+            if not batch:
+                break
+            if dry_run:
+                if progress:
+                    for borrowing in batch:
+                        progress(f'  would remind {borrowing.borrower_email} about "{borrowing.book.title}" (due {borrowing.due_date})')
+            else:
+                connection.send_messages([reminder_message(b, kind, today, connection) for b in batch])
+                mark_reminded(kind, batch)
+            sent += len(batch)
+            # Dry runs save no marks, the position in this run keeps the loop going forward
+            after = (batch[-1].due_date, batch[-1].pk)
+            if progress:
+                progress(f'{kind}: {sent} reminder(s) so far')
+            if len(batch) < batch_size:
+                break
+    finally:
+        if connection:
+            connection.close()
+    return sent
@@ -0,0 +1,152 @@
+"""
+Catalog search backends.
+
+book_list answers SearchForm queries through get_search_backend(). The backend
+is chosen with the LIBRARY_SEARCH_BACKEND setting, so the SQLite FTS5 index can
+be swapped for the plain icontains lookup (or another engine) without touching
+the views.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+
+DEFAULT_SEARCH_BACKEND = 'library.search.SQLiteFTSSearchBackend'
+
+_backend = None
+
+
+class BaseSearchBackend:
+    """Interface every search backend implements"""
+
+    def search(self, queryset, query):
+        """Return `queryset` narrowed (and ideally ranked) by `query`"""
+        raise NotImplementedError
+
+    def index_book(self, book):
+        """Add or refresh a single book in the index"""
+
+    def remove_book(self, book_id):
+        """Drop a single book from the index"""
+
+    def index_author(self, author):
+        """Refresh the author name stored for all books by `author`"""
+
+    def rebuild(self):
+        """Rebuild the whole index from the Book table, returns row count"""
+        return 0
+
+
+class IcontainsSearchBackend(BaseSearchBackend):
+    """Unindexed LIKE search, works on any database but scans every row"""
+
+    def search(self, queryset, query):
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(author__name__icontains=query) |
+            Q(isbn__icontains=query) |
+            Q(description__icontains=query)
+        )
+
+
+class SQLiteFTSSearchBackend(BaseSearchBackend):
+    """
+    Ranked prefix search over an FTS5 virtual table (created in migration 0003).
+
+    The table rowid is the Book id and is kept in sync by the receivers in
+    library/signals.py. On other databases this backend falls back to icontains.
+    """
+    table = 'library_book_fts'
+    # bm25() column weights: title, author, isbn, description
+    weights = (10.0, 5.0, 5.0, 1.0)
+
+    def __init__(self):
+        self.fallback = IcontainsSearchBackend()
+
+    @property
+    def enabled(self):
+        return connection.vendor == 'sqlite'
+
+    def search(self, queryset, query):
+        if not self.enabled:
+            return self.fallback.search(queryset, query)
+
+        match = build_match_expression(query)
+        if not match:
+            return queryset.none()
+
+        weights = ', '.join(str(weight) for weight in self.weights)
+        return queryset.extra(
+            tables=[self.table],
+            where=[
+                f'{self.table}.rowid = {queryset.model._meta.db_table}.id',
+                f'{self.table} MATCH %s',
+            ],
+            params=[match],
+            select={'search_rank': f'bm25({self.table}, {weights})'},
+            order_by=['search_rank'],
+        )
+
+    def index_book(self, book):
+        if not self.enabled:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [book.pk])
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, title, author, isbn, description) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                [book.pk, book.title, book.author.name, book.isbn or '', book.description or ''],
+            )
+
+    def remove_book(self, book_id):
+        if not self.enabled:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [book_id])
+
+    def index_author(self, author):
+        if not self.enabled:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {self.table} SET author = %s '
+                f'WHERE rowid IN (SELECT id FROM library_book WHERE author_id = %s)',
+                [author.name, author.pk],
+            )
+
+    def rebuild(self):
+        if not self.enabled:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, title, author, isbn, description) '
+                f'SELECT b.id, b.title, a.name, COALESCE(b.isbn, \'\'), COALESCE(b.description, \'\') '
+                f'FROM library_book b JOIN library_author a ON a.id = b.author_id'
+            )
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+            cursor.execute(f'SELECT COUNT(*) FROM {self.table}')
+            return cursor.fetchone()[0]
+
+
+def build_match_expression(query):
+    """
+    Turn free text into an FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix term ("harr"* matches "harry"), and terms
+    are ANDed, so FTS syntax typed by users can never raise a parse error.
+    """
+    terms = re.findall(r'\w+', query.lower())
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def get_search_backend():
+    """Return the configured search backend instance"""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'LIBRARY_SEARCH_BACKEND', DEFAULT_SEARCH_BACKEND)
+        _backend = import_string(path)()
+    return _backend
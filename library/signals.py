@@ -0,0 +1,315 @@
+"""
+Model signal receivers that keep derived data in sync with the catalog.
+
+Connected in LibraryConfig.ready().
+"""
+import logging
+
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Book, Author, Genre, Borrowing
+from .access import invalidate_borrowed_book_ids
+from .auth import invalidate_cached_user
+from . import autocomplete
+from .fragments import bump_book_versions
+from .images import delete_variants, generate_variants
+from .pagecache import author_tag, book_tag, purge_pages
+from .pages import current_pages, remove_book_pages, schedule_split
+from .search import get_search_backend
+from .stats import adjust_stats, rebuild_stats
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, **kwargs):
+    """Refresh the search index entry of a saved book"""
+    get_search_backend().index_book(instance)
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, **kwargs):
+    """Drop a deleted book from the search index"""
+    get_search_backend().remove_book(instance.pk)
+
+
+@receiver(post_save, sender=Author)
+def reindex_author_books(sender, instance, created, **kwargs):
+    """Author names are indexed with their books, so renames must propagate"""
+    if not created:
+        get_search_backend().index_author(instance)
+
+
+def touch(model, *pks):
+    """Move updated_at forward with an UPDATE that sends no further signals"""
+    if pks:
+        model.objects.filter(pk__in=pks).update(updated_at=timezone.now())
+
+
+# Cached book card / detail fragments (library/fragments.py), anonymous
+# catalog pages (library/pagecache.py) and the detail page validators
+# (library/conditional.py), which need a newer updated_at after every change
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def purge_book_caches(sender, instance, **kwargs):
+    bump_book_versions([instance.pk])
+    # The author pages list the book, before and after a change of author
+    purge_pages(
+        'books', book_tag(instance.pk),
+        author_tag(instance.author_id), author_tag(instance._loaded_author_id),
+    )
+    # A book leaving an author's page leaves no newer row behind
+    if kwargs['signal'] is post_delete:
+        touch(Author, instance.author_id)
+    elif instance._loaded_author_id not in (None, instance.author_id):
+        touch(Author, instance._loaded_author_id)
+    instance._loaded_author_id = instance.author_id
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Genre)
+def purge_related_book_caches(sender, instance, created, **kwargs):
+    """Cards and detail pages show the author/genre name"""
+    tags = ['authors', author_tag(instance.pk)] if sender is Author else ['genres']
+    if not created:
+        book_ids = list(instance.books.values_list('pk', flat=True))
+        bump_book_versions(book_ids)
+        tags += [book_tag(pk) for pk in book_ids]
+    purge_pages(*tags)
+
+
+@receiver(post_delete, sender=Author)
+def purge_author_pages(sender, instance, **kwargs):
+    # Its books are deleted first and purge their own pages
+    purge_pages('authors', author_tag(instance.pk))
+
+
+@receiver(pre_delete, sender=Genre)
+def purge_genre_book_caches(sender, instance, **kwargs):
+    # Its books are set to no genre with an UPDATE that sends no signals
+    book_ids = list(instance.books.values_list('pk', flat=True))
+    touch(Book, *book_ids)
+    bump_book_versions(book_ids)
+    purge_pages('genres', 'books', *[book_tag(pk) for pk in book_ids])
+
+
+@receiver(post_save, sender=Borrowing)
+@receiver(post_delete, sender=Borrowing)
+def purge_borrowed_book_pages(sender, instance, **kwargs):
+    """
+    Borrows and returns change the copy counts with Book UPDATEs that send no
+    signals, so the pages showing them are purged from here
+    """
+    book = Borrowing.book.field.get_cached_value(instance, None)
+    if book is not None:
+        author_id = book.author_id
+    else:
+        author_id = Book.objects.filter(pk=instance.book_id).values_list('author_id', flat=True).first()
+    purge_pages('books', book_tag(instance.book_id), author_tag(author_id))
+    if kwargs['signal'] is post_delete and not instance.is_returned:
+        # Gone from the book's active borrowings
+        touch(Book, instance.book_id)
+
+
+# Autocomplete prefix index, updated once the change is committed
+
+@receiver(post_save, sender=Book)
+def update_autocomplete_book(sender, instance, **kwargs):
+    if autocomplete.tracking_changes():
+        values = (instance.pk, instance.title, instance.isbn, instance.author.name)
+        transaction.on_commit(lambda: autocomplete.add_book(*values))
+
+
+@receiver(post_delete, sender=Book)
+def remove_autocomplete_book(sender, instance, **kwargs):
+    if autocomplete.tracking_changes():
+        pk = instance.pk
+        transaction.on_commit(lambda: autocomplete.remove('book', pk))
+
+
+@receiver(post_save, sender=Author)
+def update_autocomplete_author(sender, instance, created, **kwargs):
+    if autocomplete.tracking_changes():
+        book_ids = [] if created else list(instance.books.values_list('pk', flat=True))
+        pk, name = instance.pk, instance.name
+        transaction.on_commit(lambda: autocomplete.add_author(pk, name, book_ids))
+
+
+@receiver(post_delete, sender=Author)
+def remove_autocomplete_author(sender, instance, **kwargs):
+    if autocomplete.tracking_changes():
+        pk = instance.pk
+        transaction.on_commit(lambda: autocomplete.remove('author', pk))
+
+
+# Cover image variants (library/images.py)
+
+@receiver(post_save, sender=Book)
+def generate_cover_variants(sender, instance, **kwargs):
+    """Resize a newly uploaded cover into its WebP/JPEG variants"""
+    # Deferred cover_image (e.g. .only() loads) was not loaded, so not changed
+    if 'cover_image' not in instance.__dict__:
+        return
+    name = instance.cover_image.name or None
+    loaded = instance._loaded_cover_image
+    if loaded and loaded != name:
+        # Replaced or cleared, the old variants are unreachable now
+        transaction.on_commit(lambda: delete_variants(loaded))
+    instance._loaded_cover_image = name
+    if not name:
+        return
+    try:
+        generate_variants(instance.cover_image)
+    except OSError:
+        # An undecodable upload must not break saving the book
+        logger.warning('Could not generate cover variants for %s', instance.cover_image.name, exc_info=True)
+
+
+@receiver(post_delete, sender=Book)
+def remove_cover_variants(sender, instance, **kwargs):
+    name = instance.__dict__.get('cover_image')
+    name = getattr(name, 'name', name)
+    if name:
+        transaction.on_commit(lambda: delete_variants(name))
+
+
+# Per-page content assets and text index (library/pages.py)
+
+@receiver(post_save, sender=Book)
+def split_new_content(sender, instance, created, **kwargs):
+    # Deferred content_file (e.g. .only() loads) was not loaded, so not changed
+    if 'content_file' not in instance.__dict__:
+        return
+    name = instance.content_file.name or None
+    loaded = instance._loaded_content_file
+    if not name:
+        if loaded:
+            remove_book_pages(instance.pk)
+    elif name != loaded:
+        # Loaded after a deferred load, only a missing split tells it is new
+        if created or loaded is not None or not current_pages(instance).exists():
+            schedule_split(instance)
+    instance._loaded_content_file = name
+
+
+@receiver(pre_delete, sender=Book)
+def remove_content_pages(sender, instance, **kwargs):
+    # Before the cascade, which would leave the index rows and files behind
+    remove_book_pages(instance.pk)
+
+
+@receiver(post_save, sender=Borrowing)
+@receiver(post_delete, sender=Borrowing)
+def invalidate_borrower_cache(sender, instance, **kwargs):
+    """A borrow, return or edit changes which books the borrower may read"""
+    invalidate_borrowed_book_ids(instance.borrower_email)
+    if instance._loaded_borrower_email != instance.borrower_email:
+        invalidate_borrowed_book_ids(instance._loaded_borrower_email)
+    instance._loaded_borrower_email = instance.borrower_email
+
+
+# Cached request.user rows (library/auth.py). Saves include password changes
+# and the last_login update on login
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_cache(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk)
+
+
+@receiver(user_logged_out)
+def invalidate_logged_out_user(sender, request, user, **kwargs):
+    if user is not None:
+        invalidate_cached_user(user.pk)
+
+
+# Dashboard statistics
+# Book.status and Borrowing.is_returned are remembered as loaded, so a save
+# only has to apply the difference. Deferred fields are read from __dict__ to
+# avoid a query; an unknown previous value falls back to a full rebuild.
+
+@receiver(post_init, sender=Book)
+def remember_book_status(sender, instance, **kwargs):
+    instance._stats_status = instance.__dict__.get('status')
+    # For purging the previous author's page (library/pagecache.py)
+    instance._loaded_author_id = instance.__dict__.get('author_id')
+    # For splitting newly uploaded content only (library/pages.py)
+    content_file = instance.__dict__.get('content_file')
+    instance._loaded_content_file = getattr(content_file, 'name', content_file) or None
+    # For removing the variants of a replaced cover (library/images.py)
+    cover_image = instance.__dict__.get('cover_image')
+    instance._loaded_cover_image = getattr(cover_image, 'name', cover_image) or None
+
+
+@receiver(post_init, sender=Borrowing)
+def remember_borrowing_state(sender, instance, **kwargs):
+    instance._stats_is_returned = instance.__dict__.get('is_returned')
+    instance._loaded_borrower_email = instance.__dict__.get('borrower_email')
+
+
+@receiver(post_save, sender=Book)
+def update_book_stats(sender, instance, created, **kwargs):
+    is_available = instance.status == 'available'
+    if created:
+        adjust_stats(total_books=1, available_books=int(is_available))
+    elif instance._stats_status is None:
+        rebuild_stats()
+    else:
+        was_available = instance._stats_status == 'available'
+        adjust_stats(available_books=int(is_available) - int(was_available))
+    instance._stats_status = instance.status
+
+
+@receiver(post_delete, sender=Book)
+def remove_book_stats(sender, instance, **kwargs):
+    if instance._stats_status is None:
+        rebuild_stats()
+    else:
+        adjust_stats(total_books=-1, available_books=-int(instance._stats_status == 'available'))
+
+
+@receiver(post_save, sender=Borrowing)
+def update_borrowing_stats(sender, instance, created, **kwargs):
+    if created:
+        adjust_stats(borrowed_books=0 if instance.is_returned else 1)
+    elif instance._stats_is_returned is None:
+        rebuild_stats()
+    elif instance._stats_is_returned != instance.is_returned:
+        adjust_stats(borrowed_books=-1 if instance.is_returned else 1)
+    instance._stats_is_returned = instance.is_returned
+
+
+@receiver(post_delete, sender=Borrowing)
+def remove_borrowing_stats(sender, instance, **kwargs):
+    if instance._stats_is_returned is None:
+        rebuild_stats()
+    elif not instance._stats_is_returned:
+        adjust_stats(borrowed_books=-1)
+
+
+@receiver(post_save, sender=Author)
+def update_author_stats(sender, instance, created, **kwargs):
+    if created:
+        adjust_stats(total_authors=1)
+
+
+@receiver(post_delete, sender=Author)
+def remove_author_stats(sender, instance, **kwargs):
+    adjust_stats(total_authors=-1)
+
+
+@receiver(post_save, sender=Genre)
+def update_genre_stats(sender, instance, created, **kwargs):
+    if created:
+        adjust_stats(total_genres=1)
+
+
+@receiver(post_delete, sender=Genre)
+def remove_genre_stats(sender, instance, **kwargs):
+    adjust_stats(total_genres=-1)
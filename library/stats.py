@@ -0,0 +1,51 @@
+"""
+Dashboard statistics for the home page.
+
+The counters live in a single LibraryStats row that the receivers in
+library/signals.py adjust with F() expressions as books, authors, genres and
+borrowings change. Bulk operations that bypass signals (QuerySet.update,
+raw SQL) should be followed by `manage.py rebuild_library_stats`.
+"""
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Author, Book, Borrowing, Genre, LibraryStats
+
+
+STATS_PK = 1
+
+
+def compute_stats():
+    """Count everything from scratch (five COUNT queries)"""
+    return {
+        'total_books': Book.objects.count(),
+        'total_authors': Author.objects.count(),
+        'total_genres': Genre.objects.count(),
+        'borrowed_books': Borrowing.objects.filter(is_returned=False).count(),
+        'available_books': Book.objects.filter(status='available').count(),
+    }
+
+
+def rebuild_stats():
+    """Recompute the stats row and return it"""
+    stats, _ = LibraryStats.objects.update_or_create(pk=STATS_PK, defaults=compute_stats())
+    return stats
+
+
+def get_stats():
+    """Return the stats row, building it on first use"""
+    stats = LibraryStats.objects.filter(pk=STATS_PK).first()
+    if stats is None:
+        stats = rebuild_stats()
+    return stats
+
+
+def adjust_stats(**deltas):
+    """
+    Apply counter deltas in a single UPDATE, e.g. adjust_stats(total_books=1).
+
+    A missing row is left alone, get_stats() will build it with correct values.
+    """
+    changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if changes:
+        LibraryStats.objects.filter(pk=STATS_PK).update(updated_at=timezone.now(), **changes)
@@ -0,0 +1,34 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from library.images import VARIANT_WIDTHS, srcset, variant_name, variant_widths
+
+register = template.Library()
+
+CARD_SIZES = '(max-width: 600px) 100vw, 300px'
+
+
+@register.simple_tag
+def cover_picture(image_field, alt, css_class='', sizes=CARD_SIZES):
+    """
+    Responsive <picture> for a cover image: WebP sources with a JPEG fallback.
+
+    Covers without variants yet (they are written when the book is saved or
+    by `manage.py generate_cover_variants`) use the original URL as-is.
+    """
+    widths = variant_widths(image_field.name)
+    if not widths:
+        return format_html('<img src="{}" alt="{}" class="{}" loading="lazy">', image_field.url, alt, css_class)
+
+    # The card-sized variant, or the largest there is for small covers
+    fallback_width = max([width for width in widths if width <= VARIANT_WIDTHS[1]] or widths[:1])
+    fallback = default_storage.url(variant_name(image_field.name, fallback_width, 'jpg'))
+    return format_html(
+        '<picture class="cover-picture">'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy" decoding="async">'
+        '</picture>',
+        srcset(image_field.name, 'webp', widths), sizes,
+        fallback, srcset(image_field.name, 'jpg', widths), sizes, alt, css_class,
+    )
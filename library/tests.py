@@ -0,0 +1,1058 @@
+import os
+import re
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock, skipUnless
+from io import BytesIO, StringIO
+
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection
+from django.db.models.signals import post_save
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import autocomplete, db
+from .access import get_borrowed_book_ids
+from .images import manifest_name, variant_name, variant_widths
+from .models import Author, Book, BookPage, Borrowing, Genre
+from .pagecache import cache_anonymous_page
+from .pages import current_pages, split_book_content, splitting_available
+from .pagination import CursorPaginator
+from .reminders import send_reminders
+from .search import get_search_backend
+from .stats import compute_stats, get_stats, rebuild_stats
+
+
+class ConcurrentBorrowingTests(TransactionTestCase):
+    """Many readers POST to borrowing_create for the same book at once"""
+
+    workers = 12
+    copies = 3
+
+    def setUp(self):
+        cache.clear()
+        author = Author.objects.create(name='Concurrent Author')
+        self.book = Book.objects.create(
+            title='Concurrent Book', author=author,
+            total_copies=self.copies, available_copies=self.copies,
+        )
+        self.users = [
+            User.objects.create_user(f'reader{i}', f'reader{i}@example.com')
+            for i in range(self.workers)
+        ]
+
+    def borrow_concurrently(self):
+        url = reverse('borrowing_create_book', args=[self.book.pk])
+        data = {
+            'book': self.book.pk,
+            'borrower_name': 'Reader',
+            'borrower_email': 'reader@example.com',
+            'due_date': (timezone.localdate() + timedelta(days=14)).isoformat(),
+        }
+        clients = []
+        for user in self.users:
+            client = Client()
+            client.force_login(user)
+            clients.append(client)
+        barrier = threading.Barrier(self.workers)
+        statuses = []
+        lock = threading.Lock()
+
+        def borrow(client):
+            try:
+                barrier.wait()
+                status = client.post(url, data).status_code
+                with lock:
+                    statuses.append(status)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=borrow, args=(client,)) for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses
+
+    def test_exactly_total_copies_are_borrowed(self):
+        statuses = self.borrow_concurrently()
+
+        # 302 to borrowing_list on success, the form again (200) when refused
+        self.assertEqual(len(statuses), self.workers)
+        self.assertEqual(statuses.count(302), self.copies)
+        self.assertEqual(statuses.count(200), self.workers - self.copies)
+        self.assertEqual(Borrowing.objects.filter(book=self.book, is_returned=False).count(), self.copies)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+        self.assertEqual(self.book.status, 'borrowed')
+
+    def test_available_copies_never_go_below_zero(self):
+        self.borrow_concurrently()
+        # A second wave finds no copies left and must not take any
+        self.users = self.users[:self.copies + 1]
+        self.workers = len(self.users)
+        statuses = self.borrow_concurrently()
+
+        self.assertNotIn(302, statuses)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+        self.assertEqual(Borrowing.objects.filter(book=self.book).count(), self.copies)
+
+    def test_return_retried_after_lock_error(self):
+        self.users, self.workers = self.users[:1], 1
+        self.borrow_concurrently()
+        borrowing = Borrowing.objects.get(book=self.book)
+        rebuild_stats()
+        attempts = []
+
+        # Fails the first attempt after the stats receiver has seen the save
+        def locked_once(sender, instance, **kwargs):
+            attempts.append(instance.pk)
+            if len(attempts) == 1:
+                raise OperationalError('database is locked')
+
+        client = Client()
+        client.force_login(self.users[0])
+        post_save.connect(locked_once, sender=Borrowing)
+        try:
+            response = client.post(reverse('borrowing_return', args=[borrowing.pk]))
+        finally:
+            post_save.disconnect(locked_once, sender=Borrowing)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(attempts), 2)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, self.copies)
+        self.assertEqual(get_stats().borrowed_books, 0)
+
+
+class StaleCursorTests(TestCase):
+    """A cursor past the end of a list redirects to its first page"""
+
+    def setUp(self):
+        cache.clear()
+        Author.objects.create(name='Only Author')
+
+    def stale_cursor(self, queryset, ordering, key):
+        return CursorPaginator(queryset, ordering, 12).encode_cursor('next', key)
+
+    def test_empty_cursor_page_redirects_to_first_page(self):
+        cursor = self.stale_cursor(Author.objects.all(), ('name', 'pk'), ['zzz', 10 ** 9])
+        response = self.client.get(reverse('author_list'), {'cursor': cursor, 'q': 'x'})
+        self.assertRedirects(response, reverse('author_list') + '?q=x', fetch_redirect_response=False)
+
+        response = self.client.get(reverse('author_list'), {'cursor': cursor})
+        self.assertRedirects(response, reverse('author_list'))
+
+    def test_book_list_redirects_to_first_page(self):
+        cursor = self.stale_cursor(Book.objects.all(), ('title', 'pk'), ['zzz', 10 ** 9])
+        response = self.client.get(reverse('book_list'), {'cursor': cursor})
+        self.assertRedirects(response, reverse('book_list'))
+
+
+def cover_upload(width, height, name='cover.png'):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), (200, 40, 40)).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class CoverVariantTests(TransactionTestCase):
+    """Cover variants follow the book's cover and only list widths that exist"""
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.author = Author.objects.create(name='Cover Author')
+
+    def render(self, book):
+        return Template('{% load library_images %}{% cover_picture book.cover_image book.title %}').render(
+            Context({'book': book})
+        )
+
+    def test_small_cover_is_not_upscaled(self):
+        book = Book.objects.create(title='Small', author=self.author, cover_image=cover_upload(300, 450))
+        name = book.cover_image.name
+
+        self.assertEqual(variant_widths(name), [200, 300])
+        html = self.render(book)
+        self.assertIn(' 300w', html)
+        self.assertNotIn(' 400w', html)
+        self.assertNotIn(' 800w', html)
+        self.assertFalse(default_storage.exists(variant_name(name, 800, 'jpg')))
+
+    def test_rendering_does_not_generate_variants(self):
+        book = Book.objects.create(title='Pending', author=self.author)
+        book.cover_image.save('pending.png', cover_upload(900, 1200), save=False)
+        Book.objects.filter(pk=book.pk).update(cover_image=book.cover_image.name)
+
+        html = self.render(book)
+        self.assertIn(book.cover_image.url, html)
+        self.assertNotIn('<picture', html)
+        self.assertFalse(default_storage.exists(manifest_name(book.cover_image.name)))
+
+    def test_generated_variants_reach_cached_pages(self):
+        book = Book.objects.create(title='Backfilled', author=self.author)
+        book.cover_image.save('backfilled.png', cover_upload(900, 1200), save=False)
+        Book.objects.filter(pk=book.pk).update(cover_image=book.cover_image.name)
+        url = reverse('book_detail', args=[book.pk])
+        self.assertNotContains(self.client.get(url), '<picture')
+
+        call_command('generate_cover_variants', stdout=StringIO(), stderr=StringIO())
+        self.assertContains(self.client.get(url), '<picture')
+
+    def test_replaced_and_deleted_covers_drop_their_variants(self):
+        book = Book.objects.create(title='Replaced', author=self.author, cover_image=cover_upload(900, 1200))
+        old_name = book.cover_image.name
+        self.assertEqual(variant_widths(old_name), [200, 400, 800])
+
+        book.cover_image = cover_upload(500, 700, 'new-cover.png')
+        book.save()
+        new_name = book.cover_image.name
+        self.assertFalse(default_storage.exists(manifest_name(old_name)))
+        self.assertFalse(default_storage.exists(variant_name(old_name, 400, 'webp')))
+        self.assertEqual(variant_widths(new_name), [200, 400, 500])
+
+        book.delete()
+        self.assertFalse(default_storage.exists(manifest_name(new_name)))
+        self.assertFalse(default_storage.exists(variant_name(new_name, 500, 'jpg')))
+        self.assertIsNone(variant_widths(new_name))
+
+
+# Small lookup tables that are listed in full on purpose
+SCAN_ALLOWED_TABLES = {'library_genre', 'library_book_fts'}
+FULL_SCAN_RE = re.compile(r'^SCAN (\w+)\b(?! USING (?:COVERING )?INDEX)(?! VIRTUAL TABLE)')
+TEMP_SORT_RE = re.compile(r'USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT)')
+
+
+class QueryPlanTests(TestCase):
+    """
+    Every query of the read views uses an index: EXPLAIN QUERY PLAN may not
+    show a full scan or a temp B-tree sort of the large tables (SQLite only)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        genres = [Genre.objects.create(name=f'Genre {i}') for i in range(3)]
+        authors = [Author.objects.create(name=f'Author {i}') for i in range(5)]
+        cls.books = [
+            Book.objects.create(
+                title=f'Planned Book {i}', author=authors[i % 5], genre=genres[i % 3],
+                isbn=f'978000000{i:04d}', total_copies=2, available_copies=2,
+            )
+            for i in range(30)
+        ]
+        cls.regular = User.objects.create_user('plan-reader', 'plan-reader@example.com')
+        cls.staff = User.objects.create_user('plan-staff', 'plan-staff@example.com', is_staff=True)
+        today = timezone.localdate()
+        for i, book in enumerate(cls.books[:10]):
+            Borrowing.objects.create(
+                book=book, borrower_name='Plan Reader', borrower_email=cls.regular.email,
+                due_date=today + timedelta(days=i - 3), is_returned=i % 2 == 0,
+                return_date=today if i % 2 == 0 else None,
+            )
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN checks are only implemented for SQLite')
+        # Cached pages and fragments would leave nothing to check
+        cache.clear()
+
+    def pages(self):
+        book = self.books[0]
+        return [
+            ('home', None, {}),
+            ('book_list', None, {}),
+            ('book_list', None, {'query': 'Planned'}),
+            ('book_list', None, {'genre': book.genre_id}),
+            ('book_detail', [book.pk], {}),
+            ('author_list', None, {}),
+            ('author_detail', [book.author_id], {}),
+            ('genre_list', None, {}),
+            ('borrowing_list', None, {}),
+            ('borrowing_list', None, {'status': 'active'}),
+            ('borrowing_list', None, {'status': 'returned'}),
+            ('book_content_view', [book.pk], {}),
+        ]
+
+    def plan_problems(self, sql):
+        with connection.cursor() as cursor:
+            # The captured SQL already has parameters interpolated
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = [(row[1], row[-1]) for row in cursor.fetchall()]
+        # The outermost loop of the query. A temp sort is only acceptable when that
+        # loop lists an allowed table itself (the genre list, the FTS matches
+        # ranked by relevance), not when it merely looks up one row of it
+        driving = next((line for parent, line in plan if parent == 0 and line.startswith(('SCAN ', 'SEARCH '))), '')
+        sorts_allowed_table = driving.startswith('SCAN ') and driving.split()[1] in SCAN_ALLOWED_TABLES
+        problems = []
+        for parent, line in plan:
+            scan = FULL_SCAN_RE.match(line)
+            if scan and scan.group(1) not in SCAN_ALLOWED_TABLES:
+                problems.append(line)
+            elif TEMP_SORT_RE.search(line) and not (parent == 0 and sorts_allowed_table):
+                problems.append(line)
+        return problems
+
+    def test_read_views_use_indexes(self):
+        for role, user in [('anonymous', None), ('regular', self.regular), ('staff', self.staff)]:
+            client = Client()
+            if user:
+                client.force_login(user)
+            for name, args, params in self.pages():
+                url = reverse(name, args=args)
+                with self.subTest(role=role, url=url, params=params):
+                    cache.clear()
+                    with CaptureQueriesContext(connection) as queries:
+                        response = client.get(url, params)
+                    selects = [q['sql'] for q in queries.captured_queries if q['sql'].lstrip().upper().startswith('SELECT')]
+                    if response.status_code == 200:
+                        # Not answered from a cache
+                        self.assertTrue(selects, 'no queries captured')
+                    for sql in selects:
+                        self.assertEqual(self.plan_problems(sql), [], sql)
+
+
+class ImportCatalogTests(TestCase):
+    """import_catalog --on-conflict update"""
+
+    def setUp(self):
+        cache.clear()
+        author = Author.objects.create(name='Import Author')
+        self.book = Book.objects.create(
+            title='On Loan', author=author, isbn='9780000000001', total_copies=3, available_copies=1,
+        )
+        for i in range(2):
+            Borrowing.objects.create(
+                book=self.book, borrower_name='Reader', borrower_email=f'reader{i}@example.com',
+                due_date=timezone.localdate() + timedelta(days=7),
+            )
+
+    def import_csv(self, content, *args):
+        handle = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8')
+        self.addCleanup(os.remove, handle.name)
+        with handle:
+            handle.write(content)
+        out = StringIO()
+        call_command('import_catalog', handle.name, '--no-reindex', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_update_keeps_copies_on_loan(self):
+        self.import_csv(
+            'title,author,isbn,total_copies,available_copies\n'
+            'On Loan 2nd ed.,Import Author,9780000000001,5,5\n',
+            '--on-conflict', 'update',
+        )
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.title, 'On Loan 2nd ed.')
+        self.assertEqual(self.book.total_copies, 5)
+        self.assertEqual(self.book.available_copies, 3)
+        self.assertEqual(self.book.status, 'available')
+
+        self.import_csv(
+            'title,author,isbn,total_copies,available_copies\n'
+            'On Loan,Import Author,9780000000001,2,2\n',
+            '--on-conflict', 'update',
+        )
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+        self.assertEqual(self.book.status, 'borrowed')
+
+    def test_duplicate_isbns_are_counted_once(self):
+        rows = (
+            'title,author,isbn\n'
+            'First,Import Author,9780000000002\n'
+            'Second,Import Author,9780000000002\n'
+            'Third,Import Author,9780000000001\n'
+        )
+        output = self.import_csv(rows, '--on-conflict', 'update')
+        self.assertIn('1 created, 2 updated, 0 skipped', output)
+        self.assertEqual(Book.objects.get(isbn='9780000000002').title, 'Second')
+
+        output = self.import_csv(rows)
+        self.assertIn('0 created, 0 updated, 3 skipped', output)
+
+    def test_explicit_zero_copies_is_invalid(self):
+        out = self.import_csv(
+            '{"title": "No Copies", "author": "Import Author", "isbn": "9780000000002", "total_copies": 0}\n'
+            '{"title": "Default Copies", "author": "Import Author", "isbn": "9780000000003"}\n',
+            '--format', 'jsonl',
+        )
+        self.assertIn('1 invalid', out)
+        self.assertFalse(Book.objects.filter(isbn='9780000000002').exists())
+        self.assertEqual(Book.objects.get(isbn='9780000000003').total_copies, 1)
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        author = Author.objects.create(name='Export Author')
+        self.book = Book.objects.create(title='=HYPERLINK("http://example.com")', author=author)
+        Borrowing.objects.create(
+            book=self.book, borrower_name='@SUM(A1:A9)', borrower_email='export@example.com',
+            borrower_phone='+15550100', due_date=timezone.localdate() + timedelta(days=7),
+        )
+
+    def export(self, *args):
+        out = StringIO()
+        call_command('export_data', *args, stdout=out)
+        return out.getvalue()
+
+    def test_csv_cells_are_not_formulas(self):
+        output = self.export('borrowings')
+        self.assertIn("'=HYPERLINK", output)
+        self.assertIn("'@SUM(A1:A9)", output)
+        self.assertIn("'+15550100", output)
+        self.assertNotIn(',=', output)
+
+    def test_jsonl_values_are_unchanged(self):
+        output = self.export('catalog', '--format', 'jsonl')
+        self.assertIn('"title": "=HYPERLINK(\\"http://example.com\\")"', output)
+
+
+class ReminderTests(TestCase):
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.book = Book.objects.create(title='Reminded', author=Author.objects.create(name='Reminder Author'))
+
+    def borrow(self, days, email):
+        return Borrowing.objects.create(
+            book=self.book, borrower_name='Reader', borrower_email=email,
+            due_date=self.today + timedelta(days=days),
+        )
+
+    def remind(self, kind='due_soon'):
+        mail.outbox = []
+        send_reminders(kind, today=self.today)
+        return sorted(message.to[0] for message in mail.outbox)
+
+    def test_invalid_dates_are_command_errors(self):
+        for value in ['2026-02-30', 'tomorrow']:
+            with self.subTest(date=value), self.assertRaises(CommandError):
+                call_command('send_reminders', '--date', value, stdout=StringIO())
+
+    def test_borrowings_due_before_earlier_reminders_are_not_skipped(self):
+        self.borrow(2, 'later@example.com')
+        self.assertEqual(self.remind(), ['later@example.com'])
+
+        # Created after the first run but due before the borrowing reminded then
+        self.borrow(0, 'sooner@example.com')
+        self.assertEqual(self.remind(), ['sooner@example.com'])
+        self.assertEqual(self.remind(), [])
+
+    def test_renewed_borrowing_is_reminded_again(self):
+        borrowing = self.borrow(1, 'renewed@example.com')
+        self.assertEqual(self.remind(), ['renewed@example.com'])
+
+        Borrowing.objects.filter(pk=borrowing.pk).update(due_date=self.today + timedelta(days=2))
+        self.assertEqual(self.remind(), ['renewed@example.com'])
+
+    def test_overdue_and_dry_run(self):
+        self.borrow(-3, 'late@example.com')
+        self.assertEqual(send_reminders('overdue', today=self.today, dry_run=True), 1)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(self.remind('overdue'), ['late@example.com'])
+        self.assertEqual(send_reminders('overdue', today=self.today, dry_run=True), 0)
+
+
+class AutocompleteIndexTests(TransactionTestCase):
+    """The prefix index is rebuilt off the request path and swapped in"""
+
+    def setUp(self):
+        self.addCleanup(setattr, autocomplete, '_index', None)
+        self.author = Author.objects.create(name='Index Author')
+        Book.objects.create(title='Walrus Songs', author=self.author)
+        autocomplete.rebuild()
+
+    def labels(self, query):
+        return [result['label'] for result in autocomplete.suggest(query)]
+
+    def wait_for_swap(self, old):
+        for _ in range(100):
+            if autocomplete._index is not old:
+                return
+            threading.Event().wait(0.05)
+        self.fail('the rebuilt index was never swapped in')
+
+    def test_committed_changes_are_applied(self):
+        self.assertEqual(self.labels('walr'), ['Walrus Songs'])
+        Book.objects.create(title='Zebra Tales', author=self.author)
+        self.assertEqual(self.labels('zeb'), ['Zebra Tales'])
+
+    def test_old_index_is_served_during_a_rebuild(self):
+        old = autocomplete.get_index()
+        started, release = threading.Event(), threading.Event()
+        build = autocomplete.PrefixIndex.build
+
+        def slow_build(index):
+            started.set()
+            release.wait(5)
+            build(index)
+
+        with mock.patch.object(autocomplete.PrefixIndex, 'build', slow_build):
+            with override_settings(LIBRARY_AUTOCOMPLETE_MAX_AGE=0):
+                self.assertIs(autocomplete.get_index(), old)
+            self.assertTrue(started.wait(5))
+            # Neither blocks on the running rebuild
+            self.assertIs(autocomplete.get_index(), old)
+            self.assertFalse(autocomplete.rebuild(wait=False))
+            Book.objects.create(title='Quokka Diaries', author=self.author)
+            self.assertEqual(self.labels('quok'), ['Quokka Diaries'])
+            release.set()
+            self.wait_for_swap(old)
+
+        # Committed while the new index was loading, replayed before the swap
+        self.assertEqual(self.labels('quok'), ['Quokka Diaries'])
+        self.assertEqual(self.labels('walr'), ['Walrus Songs'])
+
+
+class IncrementalStatsTests(TestCase):
+    """The counters adjusted by the signals match a full recount"""
+
+    def assertMatchesRecount(self, step):
+        stats = get_stats()
+        recount = compute_stats()
+        self.assertEqual({field: getattr(stats, field) for field in recount}, recount, step)
+
+    def borrow(self, book):
+        self.assertTrue(book.checkout_copy())
+        return Borrowing.objects.create(
+            book=book, borrower_name='Reader', borrower_email='stats-reader@example.com',
+            due_date=timezone.localdate() + timedelta(days=14),
+        )
+
+    def test_counters_follow_every_change(self):
+        rebuild_stats()
+        genre = Genre.objects.create(name='Stats Genre')
+        author = Author.objects.create(name='Stats Author')
+        other_author = Author.objects.create(name='Other Stats Author')
+        single = Book.objects.create(title='Single Copy', author=author, genre=genre, total_copies=1, available_copies=1)
+        shared = Book.objects.create(title='Two Copies', author=author, total_copies=2, available_copies=2)
+        Book.objects.create(title='Other Book', author=other_author, genre=genre)
+        self.assertMatchesRecount('create')
+
+        borrowing = self.borrow(single)
+        self.borrow(shared)
+        self.assertMatchesRecount('borrow')
+
+        borrowing.is_returned = True
+        borrowing.save()
+        self.assertMatchesRecount('return')
+
+        active = self.borrow(single)
+        # Saves without the remembered values loaded
+        Book.objects.only('title').get(pk=single.pk).save()
+        Borrowing.objects.defer('is_returned').get(pk=active.pk).save()
+        self.assertMatchesRecount('deferred saves')
+
+        single.refresh_from_db()
+        single.delete()
+        self.assertMatchesRecount('book delete')
+        genre.delete()
+        author.delete()
+        self.assertMatchesRecount('genre and author delete')
+
+
+class BookSearchTests(TestCase):
+    """FTS5 catalog search: ranking and index sync through the signals"""
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('The FTS5 index only exists on SQLite')
+        cache.clear()
+        self.author = Author.objects.create(name='Mira Holt')
+        self.dragon_author = Author.objects.create(name='Dragon Press')
+
+    def titles(self, query):
+        books = get_search_backend().search(Book.objects.all(), query)
+        return [book.title for book in books]
+
+    def test_title_matches_rank_above_author_and_description_matches(self):
+        Book.objects.create(title='Sea Charts', author=self.author, description='A dragon guards the harbour')
+        Book.objects.create(title='Night Roads', author=self.dragon_author, description='Travel stories')
+        Book.objects.create(title='Dragon Winter', author=self.author, description='Travel stories')
+        Book.objects.create(title='Unrelated', author=self.author, description='Nothing here')
+
+        self.assertEqual(self.titles('dragon'), ['Dragon Winter', 'Night Roads', 'Sea Charts'])
+        # Terms are prefixes and all of them must match
+        self.assertEqual(self.titles('drag wint'), ['Dragon Winter'])
+
+    def test_book_save_and_delete_update_the_index(self):
+        book = Book.objects.create(title='Glass Harbour', author=self.author)
+        self.assertEqual(self.titles('glass'), ['Glass Harbour'])
+
+        book.title = 'Stone Harbour'
+        book.save()
+        self.assertEqual(self.titles('glass'), [])
+        self.assertEqual(self.titles('stone'), ['Stone Harbour'])
+
+        book.delete()
+        self.assertEqual(self.titles('harbour'), [])
+
+    def test_author_rename_reaches_their_books(self):
+        Book.objects.create(title='Quiet Fields', author=self.author)
+        self.assertEqual(self.titles('holt'), ['Quiet Fields'])
+
+        self.author.name = 'Mira Stanton'
+        self.author.save()
+        self.assertEqual(self.titles('holt'), [])
+        self.assertEqual(self.titles('stanton'), ['Quiet Fields'])
+
+
+class CachedUserTests(TransactionTestCase):
+    """request.user comes from the cache, until the user changes or logs out"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('cached-user', 'cached-user@example.com', 'first-password')
+        self.url = reverse('borrowing_list')
+        self.assertTrue(self.client.login(username='cached-user', password='first-password'))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def assertLoggedOut(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(reverse('login')))
+
+    def test_steady_state_requests_do_not_query_the_user(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertFalse([q['sql'] for q in queries.captured_queries if '"auth_user"' in q['sql']])
+
+    def test_password_change_ends_other_sessions(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.set_password('second-password')
+        user.save()
+        self.assertLoggedOut()
+
+    def test_deactivated_user_is_logged_out(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        user.save()
+        self.assertLoggedOut()
+
+    def test_logout_drops_the_cached_user(self):
+        self.assertIsNotNone(cache.get(f'library:user:{self.user.pk}'))
+        self.client.post(reverse('logout'))
+        self.assertIsNone(cache.get(f'library:user:{self.user.pk}'))
+        self.assertLoggedOut()
+
+
+class BorrowedBooksCacheTests(TransactionTestCase):
+    """The cached set of borrowed books behind the content access checks"""
+
+    def setUp(self):
+        cache.clear()
+        author = Author.objects.create(name='Access Author')
+        self.books = [Book.objects.create(title=f'Access Book {i}', author=author) for i in range(2)]
+        self.reader = User.objects.create_user('access-reader', 'access-reader@example.com')
+
+    def borrow(self, book):
+        return Borrowing.objects.create(
+            book=book, borrower_name='Reader', borrower_email=self.reader.email,
+            due_date=timezone.localdate() + timedelta(days=14),
+        )
+
+    def test_borrow_and_return_update_the_set(self):
+        self.assertEqual(get_borrowed_book_ids(self.reader), frozenset())
+        borrowing = self.borrow(self.books[0])
+        self.assertEqual(get_borrowed_book_ids(self.reader), {self.books[0].pk})
+        borrowing.is_returned = True
+        borrowing.save()
+        self.assertEqual(get_borrowed_book_ids(self.reader), frozenset())
+
+    def test_fill_stored_after_an_invalidation_is_not_served(self):
+        backend = caches['default']
+        store = backend.set
+
+        # A borrow commits between the fill's query and its cache.set()
+        def set_after_a_borrow(key, value, *args, **kwargs):
+            if key.startswith('library:borrowed-books:') and not Borrowing.objects.exists():
+                self.borrow(self.books[1])
+            return store(key, value, *args, **kwargs)
+
+        with mock.patch.object(backend, 'set', side_effect=set_after_a_borrow):
+            self.assertEqual(get_borrowed_book_ids(self.reader), frozenset())
+        self.assertEqual(get_borrowed_book_ids(self.reader), {self.books[1].pk})
+
+
+@override_settings(LIBRARY_READ_REPLICA='default')
+class ReadReplicaPinTests(TestCase):
+    """A client that wrote reads from the primary for a while"""
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        client = Client()
+        response = client.post(reverse('login'), {'username': 'nobody', 'password': 'wrong'})
+        self.assertIn(db.PRIMARY_PIN_COOKIE, response.cookies)
+        response = client.get(reverse('genre_list'))
+        self.assertNotIn(db.PRIMARY_PIN_COOKIE, response.cookies)
+
+        view = db.use_read_replica(lambda request: db._use_replica.get())
+        request = RequestFactory().get('/')
+        self.assertTrue(view(request))
+        request.COOKIES[db.PRIMARY_PIN_COOKIE] = client.cookies[db.PRIMARY_PIN_COOKIE].value
+        self.assertFalse(view(request))
+
+    def test_replica_behind_on_migrations_is_not_read(self):
+        db._replica_checks.clear()
+        self.addCleanup(db._replica_checks.clear)
+        applied = db._applied_migrations('default')
+        # The replica's migrations are read first, then the primary's
+        checks = [applied - {('library', '0007_page_validators')}, applied]
+        with mock.patch.object(db, '_applied_migrations', side_effect=checks):
+            self.assertIsNone(db.readable_replica_alias())
+            # Not checked again within LIBRARY_READ_REPLICA_CHECK_SECONDS
+            self.assertIsNone(db.readable_replica_alias())
+        with override_settings(LIBRARY_READ_REPLICA_CHECK_SECONDS=0):
+            self.assertEqual(db.readable_replica_alias(), 'default')
+
+
+@override_settings(LIBRARY_SPLIT_CONTENT_ON_SAVE=False)
+class ContentFileTests(TestCase):
+    """Byte ranges, If-Range and revalidation of the content download"""
+
+    data = bytes(range(100))
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        author = Author.objects.create(name='Content Author')
+        self.book = Book.objects.create(
+            title='Content Book', author=author, content_file=SimpleUploadedFile('content.txt', self.data),
+        )
+        self.url = reverse('book_content_download', args=[self.book.pk])
+        self.client.force_login(User.objects.create_user('content-staff', is_staff=True))
+
+    def download(self, **headers):
+        return self.client.get(self.url, headers=headers)
+
+    def test_single_range(self):
+        response = self.download(Range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(b''.join(response.streaming_content), self.data[10:20])
+
+        response = self.download(Range='bytes=-5')
+        self.assertEqual(response['Content-Range'], 'bytes 95-99/100')
+        self.assertEqual(b''.join(response.streaming_content), self.data[-5:])
+
+    def test_unsatisfiable_range(self):
+        response = self.download(Range='bytes=100-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    def test_suffix_range_of_an_empty_file(self):
+        self.book.content_file.save('empty.txt', SimpleUploadedFile('empty.txt', b''))
+        response = self.download(Range='bytes=-5')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */0')
+
+    def test_mismatched_if_range_sends_the_whole_file(self):
+        etag = self.download()['ETag']
+        response = self.download(Range='bytes=10-19', If_Range=etag)
+        self.assertEqual(response.status_code, 206)
+
+        response = self.download(Range='bytes=10-19', If_Range='"changed"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+
+    def test_etag_revalidation(self):
+        etag = self.download()['ETag']
+        response = self.download(If_None_Match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_sendfile_backends(self):
+        with override_settings(LIBRARY_SENDFILE_BACKEND='x-sendfile'):
+            response = self.download(Range='bytes=10-19')
+        # The front-end server answers the range itself
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Sendfile'], self.book.content_file.path)
+        self.assertEqual(response.content, b'')
+
+        with override_settings(LIBRARY_SENDFILE_BACKEND='x-accel-redirect'):
+            response = self.download()
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.book.content_file.name}')
+        self.assertIn('attachment;', response['Content-Disposition'])
+
+
+class ConditionalDetailPageTests(TransactionTestCase):
+    """
+    ETag/Last-Modified of the book detail page, revalidated around borrows and
+    returns (whose copy count updates run through on_commit invalidation)
+    """
+
+    def setUp(self):
+        cache.clear()
+        genre = Genre.objects.create(name='Conditional Genre')
+        author = Author.objects.create(name='Conditional Author')
+        self.book = Book.objects.create(title='Conditional Book', author=author, genre=genre, total_copies=2, available_copies=2)
+        # Changed well before the first visit, so Last-Modified is sent
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        for model, pk in [(Genre, genre.pk), (Author, author.pk), (Book, self.book.pk)]:
+            model.objects.filter(pk=pk).update(updated_at=an_hour_ago)
+        self.url = reverse('book_detail', args=[self.book.pk])
+        self.reader = User.objects.create_user('conditional-reader', 'conditional-reader@example.com')
+        self.borrower = Client()
+        self.borrower.force_login(self.reader)
+
+    def borrow(self):
+        response = self.borrower.post(reverse('borrowing_create_book', args=[self.book.pk]), {
+            'book': self.book.pk,
+            'borrower_name': 'Reader',
+            'borrower_email': self.reader.email,
+            'due_date': (timezone.localdate() + timedelta(days=14)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 302)
+        return Borrowing.objects.get(book=self.book, is_returned=False)
+
+    def return_book(self, borrowing):
+        response = self.borrower.post(reverse('borrowing_return', args=[borrowing.pk]))
+        self.assertEqual(response.status_code, 302)
+
+    def first_visit(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        return response
+
+    def assertRevalidates(self, headers):
+        self.assertEqual(self.client.get(self.url, headers=headers).status_code, 304)
+
+    def assertChanged(self, headers):
+        response = self.client.get(self.url, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Conditional Book')
+
+    def test_if_none_match(self):
+        etag = self.first_visit()['ETag']
+        self.assertRevalidates({'If-None-Match': etag})
+
+        borrowing = self.borrow()
+        self.assertChanged({'If-None-Match': etag})
+
+        etag = self.client.get(self.url)['ETag']
+        self.assertRevalidates({'If-None-Match': etag})
+        self.return_book(borrowing)
+        self.assertChanged({'If-None-Match': etag})
+
+    def test_if_modified_since(self):
+        last_modified = self.first_visit()['Last-Modified']
+        self.assertRevalidates({'If-Modified-Since': last_modified})
+
+        borrowing = self.borrow()
+        self.assertChanged({'If-Modified-Since': last_modified})
+
+        self.return_book(borrowing)
+        self.assertChanged({'If-Modified-Since': last_modified})
+
+    def test_no_last_modified_within_the_changing_second(self):
+        self.borrow()
+        changed = Book.objects.get(pk=self.book.pk).updated_at.timestamp()
+        with mock.patch('library.conditional.time.time', return_value=changed):
+            response = self.client.get(self.url)
+        # A second change in this second would not move Last-Modified forward
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('ETag', response)
+        with mock.patch('library.conditional.time.time', return_value=changed + 1):
+            self.assertIn('Last-Modified', self.client.get(self.url))
+
+
+class PageCacheTests(TransactionTestCase):
+    """
+    Anonymous pages are served from the cache until a committed change purges
+    one of their tags, including changes made by signal-less UPDATEs
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.genre = Genre.objects.create(name='Cached Genre')
+        self.author = Author.objects.create(name='First Author')
+        self.other_author = Author.objects.create(name='Second Author')
+        self.book = Book.objects.create(
+            title='Cached Book', author=self.author, genre=self.genre, total_copies=2, available_copies=2,
+        )
+        self.detail_url = reverse('book_detail', args=[self.book.pk])
+        self.reader = User.objects.create_user('cached-reader', 'cached-reader@example.com')
+        self.borrower = Client()
+        self.borrower.force_login(self.reader)
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def cache_page(self, url, params=None):
+        self.assertEqual(self.get(url, params)['X-Page-Cache'], 'miss')
+        return self.assertHit(url, params)
+
+    def assertHit(self, url, params=None):
+        response = self.get(url, params)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        return response
+
+    def assertRefreshed(self, url, params=None):
+        response = self.get(url, params)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        return response
+
+    def test_author_reassignment_refreshes_both_author_pages(self):
+        old_url = reverse('author_detail', args=[self.author.pk])
+        new_url = reverse('author_detail', args=[self.other_author.pk])
+        self.assertContains(self.cache_page(old_url), 'Cached Book')
+        self.assertNotContains(self.cache_page(new_url), 'Cached Book')
+        self.cache_page(self.detail_url)
+
+        self.book.author = self.other_author
+        self.book.save()
+
+        self.assertNotContains(self.assertRefreshed(old_url), 'Cached Book')
+        self.assertContains(self.assertRefreshed(new_url), 'Cached Book')
+        self.assertContains(self.assertRefreshed(self.detail_url), 'Second Author')
+        self.assertHit(new_url)
+
+    def test_genre_delete_refreshes_its_books(self):
+        self.assertContains(self.cache_page(self.detail_url), 'Cached Genre')
+        self.assertContains(self.cache_page(reverse('genre_list')), 'Cached Genre')
+
+        # Its books are set to no genre with an UPDATE, without signals
+        self.genre.delete()
+
+        self.assertNotContains(self.assertRefreshed(self.detail_url), 'Cached Genre')
+        self.assertNotContains(self.assertRefreshed(reverse('genre_list')), 'Cached Genre')
+
+    def test_borrow_and_return_refresh_copy_counts(self):
+        author_url = reverse('author_detail', args=[self.author.pk])
+        self.assertContains(self.cache_page(self.detail_url), 'Available: 2 copies')
+        self.assertContains(self.cache_page(author_url), '2/2 copies')
+
+        response = self.borrower.post(reverse('borrowing_create_book', args=[self.book.pk]), {
+            'book': self.book.pk,
+            'borrower_name': 'Reader',
+            'borrower_email': self.reader.email,
+            'due_date': (timezone.localdate() + timedelta(days=14)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertContains(self.assertRefreshed(self.detail_url), 'Available: 1 copy')
+        self.assertContains(self.assertRefreshed(author_url), '1/2 copies')
+        self.assertHit(self.detail_url)
+
+        borrowing = Borrowing.objects.get(book=self.book, is_returned=False)
+        response = self.borrower.post(reverse('borrowing_return', args=[borrowing.pk]))
+        self.assertEqual(response.status_code, 302)
+        self.assertContains(self.assertRefreshed(self.detail_url), 'Available: 2 copies')
+        self.assertContains(self.assertRefreshed(author_url), '2/2 copies')
+
+    def test_authenticated_and_message_responses_are_not_stored(self):
+        url = reverse('home')
+        response = self.borrower.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Page-Cache', response)
+
+        self.client.cookies[CookieStorage.cookie_name] = 'pending'
+        self.assertNotIn('X-Page-Cache', self.get(url))
+        del self.client.cookies[CookieStorage.cookie_name]
+
+        # Neither request left an entry behind
+        self.assertRefreshed(url)
+
+    def test_cookie_setting_and_non_get_responses_are_not_stored(self):
+        factory = RequestFactory()
+        rendered = []
+
+        @cache_anonymous_page(['books'])
+        def view(request):
+            response = HttpResponse('page')
+            # Only the first render sets a cookie
+            if not rendered:
+                response.set_cookie('seen', '1')
+            rendered.append(request.method)
+            return response
+
+        view(factory.get('/cached/'))
+        view(factory.post('/cached/'))
+        view(factory.head('/cached/'))
+        self.assertEqual(view(factory.get('/cached/'))['X-Page-Cache'], 'miss')
+        self.assertEqual(view(factory.get('/cached/'))['X-Page-Cache'], 'hit')
+        self.assertEqual(rendered, ['GET', 'POST', 'HEAD', 'GET'])
+
+
+def pdf_upload(pages, name='content.pdf'):
+    import pypdf
+
+    writer = pypdf.PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    buffer = BytesIO()
+    writer.write(buffer)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='application/pdf')
+
+
+@skipUnless(splitting_available(), 'needs pypdf')
+@override_settings(LIBRARY_SPLIT_CONTENT_ON_SAVE=False)
+class SplitBookContentTests(TransactionTestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.book = Book.objects.create(
+            title='Split Book', author=Author.objects.create(name='Split Author'), content_file=pdf_upload(4),
+        )
+
+    def page_files(self):
+        return sorted(default_storage.listdir(f'book_content/pages/{self.book.pk}')[1])
+
+    def test_concurrent_splits_replace_the_pages_once(self):
+        errors = []
+
+        def split():
+            try:
+                split_book_content(Book.objects.get(pk=self.book.pk))
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=split) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(current_pages(self.book).values_list('number', flat=True)), [1, 2, 3, 4])
+        self.assertEqual(self.page_files(), sorted(p.rsplit('/', 1)[1] for p in BookPage.objects.values_list('file', flat=True)))
+
+    def test_split_of_replaced_content_is_discarded(self):
+        stale = Book.objects.get(pk=self.book.pk)
+        self.book.content_file = pdf_upload(2, 'newer.pdf')
+        self.book.save()
+
+        self.assertEqual(split_book_content(stale), 0)
+        self.assertFalse(BookPage.objects.exists())
+        self.assertEqual(self.page_files(), [])
+        self.assertEqual(split_book_content(self.book), 2)
@@ -1,6 +1,13 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# Read-heavy views have native async versions for ASGI servers
+if getattr(settings, 'LIBRARY_ASYNC_VIEWS', False):
+    from . import async_views as read_views
+else:
+    read_views = views
+
 urlpatterns = [
     # Authentication
     path('register/', views.register_view, name='register'),
@@ -8,16 +15,20 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
     
     # Home
-    path('', views.home, name='home'),
+    path('', read_views.home, name='home'),
     
     # Books
-    path('books/', views.book_list, name='book_list'),
-    path('books/<int:pk>/', views.book_detail, name='book_detail'),
-    path('books/<int:pk>/view/', views.book_content_view, name='book_content_view'),
-    path('books/<int:pk>/download/', views.book_content_download, name='book_content_download'),
+    path('books/', read_views.book_list, name='book_list'),
+    path('books/autocomplete/', views.book_autocomplete, name='book_autocomplete'),
+    path('books/<int:pk>/', read_views.book_detail, name='book_detail'),
+    path('books/<int:pk>/view/', read_views.book_content_view, name='book_content_view'),
+    path('books/<int:pk>/download/', read_views.book_content_download, name='book_content_download'),
+    path('books/<int:pk>/pages/<int:number>/', read_views.book_content_page, name='book_content_page'),
+    path('books/<int:pk>/search/', views.book_content_search, name='book_content_search'),
     path('books/add/', views.book_create, name='book_create'),
     path('books/<int:pk>/edit/', views.book_update, name='book_update'),
     path('books/<int:pk>/delete/', views.book_delete, name='book_delete'),
+    path('books/export/', views.catalog_export, name='catalog_export'),
     
     # Authors
     path('authors/', views.author_list, name='author_list'),
@@ -30,8 +41,12 @@ urlpatterns = [
     
     # Borrowings
     path('borrowings/', views.borrowing_list, name='borrowing_list'),
+    path('borrowings/export/', views.borrowing_export, name='borrowing_export'),
     path('borrowings/add/', views.borrowing_create, name='borrowing_create'),
     path('borrowings/add/<int:book_pk>/', views.borrowing_create, name='borrowing_create_book'),
     path('borrowings/<int:pk>/return/', views.borrowing_return, name='borrowing_return'),
+
+    # Instrumentation
+    path('performance/', views.performance_stats, name='performance_stats'),
 ]
 
@@ -3,13 +3,36 @@ from django.contrib import messages
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.forms import UserCreationForm
-from django.db.models import Q
-from django.core.paginator import Paginator
-from django.http import HttpResponseForbidden, FileResponse, Http404
+from django.db.models import BooleanField, Case, Count, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.http import HttpResponseForbidden, Http404, JsonResponse, StreamingHttpResponse
 from django.conf import settings
+from django.db import router
+from django.urls import reverse
+from django.utils import timezone
 import os
 from .models import Book, Author, Genre, Borrowing
 from .forms import BookForm, AuthorForm, GenreForm, BorrowingForm, SearchForm, CustomUserCreationForm
+from .access import can_access_content, get_borrowed_book_ids
+from .autocomplete import suggest
+from .performance import view_stats
+from .content import serve_content_file
+from .conditional import author_last_modified, book_last_modified, conditional_page
+from .db import run_atomic, use_read_replica
+from .fragments import attach_fragment_versions, fragment_timeout, get_book_versions
+from .pagecache import author_tag, book_tag, cache_anonymous_page
+from . import exports
+from .pages import current_pages, is_pdf, search_pages, whole_file_page_url
+from .pagination import StaleCursor, paginate
+from .search import get_search_backend
+from .stats import get_stats
+
+
+# Book columns rendered by the book cards in book_list/home/author_detail
+BOOK_CARD_FIELDS = (
+    'title', 'cover_image', 'content_file', 'status', 'available_copies', 'total_copies',
+    'updated_at',  # part of the cached card's key
+)
 
 
 def is_admin(user):
@@ -59,92 +82,105 @@ def logout_view(request):
     return redirect('home')
 
 
+@cache_anonymous_page(['books', 'authors', 'genres'])
+@use_read_replica
 def home(request):
     """Home page with statistics and recent books"""
-    total_books = Book.objects.count()
-    total_authors = Author.objects.count()
-    total_genres = Genre.objects.count()
-    borrowed_books = Borrowing.objects.filter(is_returned=False).count()
-    available_books = Book.objects.filter(status='available').count()
+    # Counters are maintained incrementally, see library/stats.py
+    stats = get_stats()
     
-    recent_books = Book.objects.all()[:6]
+    recent_books = Book.objects.select_related('author', 'genre').only(
+        *BOOK_CARD_FIELDS, 'author__name', 'genre__name'
+    )[:6]
     
     context = {
-        'total_books': total_books,
-        'total_authors': total_authors,
-        'total_genres': total_genres,
-        'borrowed_books': borrowed_books,
-        'available_books': available_books,
+        'total_books': stats.total_books,
+        'total_authors': stats.total_authors,
+        'total_genres': stats.total_genres,
+        'borrowed_books': stats.borrowed_books,
+        'available_books': stats.available_books,
         'recent_books': recent_books,
     }
     return render(request, 'library/home.html', context)
 
 
+@cache_anonymous_page(['books', 'authors', 'genres'])
+@use_read_replica
 def book_list(request):
     """List all books with search and filter"""
     form = SearchForm(request.GET)
-    books = Book.objects.all()
+    books = Book.objects.select_related('author', 'genre').only(
+        *BOOK_CARD_FIELDS, 'author__name', 'genre__name'
+    )
     
+    ordering = ('title', 'pk')
     if form.is_valid():
         query = form.cleaned_data.get('query')
         genre = form.cleaned_data.get('genre')
         
         if query:
-            books = books.filter(
-                Q(title__icontains=query) |
-                Q(author__name__icontains=query) |
-                Q(isbn__icontains=query) |
-                Q(description__icontains=query)
-            )
+            # Relevance order has no stable key, use numbered pages instead
+            ordering = None
+            # Answered from the full-text index, ordered by relevance
+            books = get_search_backend().search(books, query)
         
         if genre:
             books = books.filter(genre=genre)
     
     # Pagination
-    paginator = Paginator(books, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    try:
+        page_obj = paginate(request, books, 12, ordering)
+    except StaleCursor as stale:
+        return redirect(stale.url)
+    attach_fragment_versions(page_obj)
     
     # Get user's borrowed books for content access check
     user_borrowed_books = set()
     if request.user.is_authenticated and not request.user.is_staff:
-        user_borrowed_books = set(
-            Borrowing.objects.filter(
-                borrower_email=request.user.email,
-                is_returned=False
-            ).values_list('book_id', flat=True)
-        )
+        user_borrowed_books = get_borrowed_book_ids(request.user)
     
     context = {
         'page_obj': page_obj,
         'form': form,
         'genres': Genre.objects.all(),
         'user_borrowed_books': user_borrowed_books,
+        'fragment_timeout': fragment_timeout(),
     }
     return render(request, 'library/book_list.html', context)
 
 
+@use_read_replica
+def book_autocomplete(request):
+    """JSON suggestions (books, authors, ISBNs) for the search box"""
+    query = request.GET.get('q', '')[:200]
+    try:
+        limit = min(max(int(request.GET.get('limit', 8)), 1), 20)
+    except ValueError:
+        limit = 8
+    return JsonResponse({'query': query, 'results': suggest(query, limit)})
+
+
+@use_read_replica
+@conditional_page(book_last_modified)
+@cache_anonymous_page(lambda pk: [book_tag(pk)])
 def book_detail(request, pk):
     """Book detail page"""
-    book = get_object_or_404(Book, pk=pk)
-    borrowings = Borrowing.objects.filter(book=book, is_returned=False)
+    # Version first: a change committed in between then gets a newer version
+    fragment_version = get_book_versions([pk])[pk]
+    book = get_object_or_404(Book.objects.select_related('author', 'genre'), pk=pk)
+    book.fragment_version = fragment_version
+    borrowings = Borrowing.objects.filter(book=book, is_returned=False).only(
+        'borrower_name', 'borrower_email', 'borrow_date', 'due_date'
+    )
     
     # Check if current user has borrowed this book
-    user_has_borrowed = False
-    if request.user.is_authenticated:
-        if request.user.is_staff:
-            user_has_borrowed = True  # Admins can always access
-        else:
-            user_has_borrowed = Borrowing.objects.filter(
-                book=book,
-                borrower_email=request.user.email,
-                is_returned=False
-            ).exists()
+    user_has_borrowed = can_access_content(request.user, book)
     
     context = {
         'book': book,
         'borrowings': borrowings,
         'user_has_borrowed': user_has_borrowed,
+        'fragment_timeout': fragment_timeout(),
     }
     return render(request, 'library/book_detail.html', context)
 
@@ -159,33 +195,14 @@ def book_content_view(request, pk):
     
     # Check if user has borrowed this book (not returned)
     # Admins can always access
-    if not request.user.is_staff:
-        has_borrowed = Borrowing.objects.filter(
-            book=book,
-            borrower_email=request.user.email,
-            is_returned=False
-        ).exists()
-        
-        if not has_borrowed:
-            messages.error(request, 'You must borrow this book first to view its content.')
-            return redirect('book_detail', pk=book.pk)
+    if not can_access_content(request.user, book):
+        messages.error(request, 'You must borrow this book first to view its content.')
+        return redirect('book_detail', pk=book.pk)
     
-    file_path = book.content_file.path
-    if not os.path.exists(file_path):
-        raise Http404("File not found")
-    
-    # Determine content type
-    content_type = 'application/pdf'
-    if file_path.endswith('.doc') or file_path.endswith('.docx'):
-        content_type = 'application/msword'
-    elif file_path.endswith('.txt'):
-        content_type = 'text/plain'
-    elif file_path.endswith('.epub'):
-        content_type = 'application/epub+zip'
-    
-    response = FileResponse(open(file_path, 'rb'), content_type=content_type)
-    response['Content-Disposition'] = f'inline; filename="{book.content_file.name}"'
-    return response
+    # Supports Range requests and conditional GET, see library/content.py
+    return serve_content_file(
+        request, book.content_file, f'inline; filename="{book.content_file.name}"'
+    )
 
 
 @login_required
@@ -198,25 +215,59 @@ def book_content_download(request, pk):
     
     # Check if user has borrowed this book (not returned)
     # Admins can always access
-    if not request.user.is_staff:
-        has_borrowed = Borrowing.objects.filter(
-            book=book,
-            borrower_email=request.user.email,
-            is_returned=False
-        ).exists()
-        
-        if not has_borrowed:
-            messages.error(request, 'You must borrow this book first to download its content.')
-            return redirect('book_detail', pk=book.pk)
-    
-    file_path = book.content_file.path
-    if not os.path.exists(file_path):
-        raise Http404("File not found")
+    if not can_access_content(request.user, book):
+        messages.error(request, 'You must borrow this book first to download its content.')
+        return redirect('book_detail', pk=book.pk)
     
-    response = FileResponse(open(file_path, 'rb'))
     filename = os.path.basename(book.content_file.name)
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    return response
+    return serve_content_file(request, book.content_file, f'attachment; filename="{filename}"')
+
+
+@login_required
+def book_content_page(request, pk, number):
+    """One page of the book content as a single-page PDF - Only for users who borrowed the book"""
+    book = get_object_or_404(Book.objects.only('content_file'), pk=pk)
+    
+    if not book.content_file:
+        raise Http404("Book content not available")
+    
+    if not can_access_content(request.user, book):
+        messages.error(request, 'You must borrow this book first to view its content.')
+        return redirect('book_detail', pk=book.pk)
+    
+    # Split by library/pages.py
+    page = current_pages(book).filter(number=number).only('file').first()
+    if page is None:
+        if number < 1 or not is_pdf(book.content_file) or current_pages(book).exists():
+            raise Http404("Page not found")
+        # Not split (yet): the whole file, opened at that page
+        return redirect(whole_file_page_url(book, number))
+    filename = os.path.basename(page.file.name)
+    return serve_content_file(request, page.file, f'inline; filename="{filename}"')
+
+
+@login_required
+def book_content_search(request, pk):
+    """JSON list of the content pages matching ?q= - Only for users who borrowed the book"""
+    book = get_object_or_404(Book.objects.only('content_file'), pk=pk)
+    
+    if not book.content_file:
+        raise Http404("Book content not available")
+    
+    if not can_access_content(request.user, book):
+        return JsonResponse({'error': 'You must borrow this book first to search its content.'}, status=403)
+    
+    query = request.GET.get('q', '').strip()[:100]
+    results = search_pages(book, query) if query else []
+    return JsonResponse({
+        'query': query,
+        # False until the content is split, e.g. without the optional pypdf
+        'indexed': current_pages(book).exists(),
+        'results': [
+            {'page': number, 'snippet': snippet, 'url': reverse('book_content_page', args=[book.pk, number])}
+            for number, snippet in results
+        ],
+    })
 
 
 @user_passes_test(is_admin)
@@ -258,7 +309,7 @@ def book_update(request, pk):
 @user_passes_test(is_admin)
 def book_delete(request, pk):
     """Delete a book - Admin only"""
-    book = get_object_or_404(Book, pk=pk)
+    book = get_object_or_404(Book.objects.select_related('author'), pk=pk)
     
     if request.method == 'POST':
         book.delete()
@@ -269,22 +320,35 @@ def book_delete(request, pk):
     return render(request, 'library/book_confirm_delete.html', context)
 
 
+@cache_anonymous_page(['authors', 'books'])
+@use_read_replica
 def author_list(request):
     """List all authors"""
-    authors = Author.objects.all()
-    
-    paginator = Paginator(authors, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Count books per author in a correlated subquery, so only the authors on
+    # the page are counted and the name index can serve the ordering
+    book_counts = Book.objects.filter(author=OuterRef('pk')).order_by().values('author').annotate(
+        count=Count('pk')
+    ).values('count')
+    authors = Author.objects.only('name', 'birth_date').annotate(
+        book_count=Coalesce(Subquery(book_counts), 0)
+    )
+    
+    try:
+        page_obj = paginate(request, authors, 12, ('name', 'pk'))
+    except StaleCursor as stale:
+        return redirect(stale.url)
     
     context = {'page_obj': page_obj}
     return render(request, 'library/author_list.html', context)
 
 
+@use_read_replica
+@conditional_page(author_last_modified)
+@cache_anonymous_page(lambda pk: [author_tag(pk)])
 def author_detail(request, pk):
     """Author detail page"""
     author = get_object_or_404(Author, pk=pk)
-    books = Book.objects.filter(author=author)
+    books = Book.objects.filter(author=author).only(*BOOK_CARD_FIELDS)
     
     context = {
         'author': author,
@@ -310,9 +374,12 @@ def author_create(request):
     return render(request, 'library/author_form.html', context)
 
 
+@cache_anonymous_page(['genres', 'books'])
+@use_read_replica
 def genre_list(request):
     """List all genres"""
-    genres = Genre.objects.all()
+    # One aggregated query instead of a COUNT per genre card
+    genres = Genre.objects.annotate(book_count=Count('books')).order_by('name')
     
     context = {'genres': genres}
     return render(request, 'library/genre_list.html', context)
@@ -343,17 +410,25 @@ def borrowing_list(request):
         borrowings = Borrowing.objects.all()
     else:
         borrowings = Borrowing.objects.filter(borrower_email=request.user.email)
+    borrowings = borrowings.select_related('book').only(
+        'book__title', 'borrower_name', 'borrower_email', 'borrow_date',
+        'due_date', 'return_date', 'is_returned',
+    ).annotate(
+        # Computed in the query, so it is right regardless of when reminders last ran
+        is_overdue=Case(
+            When(is_returned=False, due_date__lt=timezone.localdate(), then=Value(True)),
+            default=Value(False), output_field=BooleanField(),
+        )
+    )
     
     # Filter by status
     status_filter = request.GET.get('status')
-    if status_filter == 'active':
-        borrowings = borrowings.filter(is_returned=False)
-    elif status_filter == 'returned':
-        borrowings = borrowings.filter(is_returned=True)
+    borrowings = exports.filter_borrowings_by_status(borrowings, status_filter)
     
-    paginator = Paginator(borrowings, 15)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    try:
+        page_obj = paginate(request, borrowings, 15, ('-borrow_date', '-pk'))
+    except StaleCursor as stale:
+        return redirect(stale.url)
     
     context = {
         'page_obj': page_obj,
@@ -362,12 +437,56 @@ def borrowing_list(request):
     return render(request, 'library/borrowing_list.html', context)
 
 
+@user_passes_test(is_admin)
+def performance_stats(request):
+    """Per-view timing percentiles of this worker process - Admin only"""
+    if request.method == 'POST':
+        view_stats.clear()
+    return JsonResponse({'views': view_stats.summary()})
+
+
+def _export_response(rows, columns, name, file_format):
+    response = StreamingHttpResponse(
+        exports.encode_rows(rows, columns, file_format),
+        content_type=exports.CONTENT_TYPES[file_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{exports.export_filename(name, file_format)}"'
+    return response
+
+
+@login_required
+@use_read_replica
+def borrowing_export(request):
+    """Stream borrowings as CSV or JSONL, with the same status filter as borrowing_list"""
+    file_format = request.GET.get('format', 'csv')
+    if file_format not in exports.EXPORT_FORMATS:
+        raise Http404("Unknown export format")
+    # Regular users export only their borrowings, admins export all
+    borrower_email = None if request.user.is_staff else request.user.email
+    # The rows are read after the view returns, so pick the database now
+    rows = exports.borrowing_export_rows(
+        request.GET.get('status'), borrower_email, using=router.db_for_read(Borrowing)
+    )
+    return _export_response(rows, exports.BORROWING_COLUMNS, 'borrowings', file_format)
+
+
+@user_passes_test(is_admin)
+@use_read_replica
+def catalog_export(request):
+    """Stream the whole catalog as CSV or JSONL - Admin only"""
+    file_format = request.GET.get('format', 'csv')
+    if file_format not in exports.EXPORT_FORMATS:
+        raise Http404("Unknown export format")
+    rows = exports.catalog_export_rows(using=router.db_for_read(Book))
+    return _export_response(rows, exports.CATALOG_COLUMNS, 'catalog', file_format)
+
+
 @login_required
 def borrowing_create(request, book_pk=None):
     """Create a new borrowing - Login required"""
     book = None
     if book_pk:
-        book = get_object_or_404(Book, pk=book_pk)
+        book = get_object_or_404(Book.objects.select_related('author'), pk=book_pk)
     
     if request.method == 'POST':
         form = BorrowingForm(request.POST)
@@ -379,12 +498,19 @@ def borrowing_create(request, book_pk=None):
             if not request.user.is_staff:
                 borrowing.borrower_name = request.user.get_full_name() or request.user.username
                 borrowing.borrower_email = request.user.email
-            # Decrease available copies
-            borrowing.book.available_copies -= 1
-            borrowing.book.save()
-            borrowing.save()
-            messages.success(request, 'Book borrowed successfully!')
-            return redirect('borrowing_list')
+            # Decrease available copies, the form check above may be stale
+            # so the conditional update is what actually guards the last copy
+            def borrow():
+                borrowing.pk = None  # a rolled back attempt may have set it
+                if borrowing.book.checkout_copy():
+                    borrowing.save()
+                    return True
+                return False
+
+            if run_atomic(borrow):
+                messages.success(request, 'Book borrowed successfully!')
+                return redirect('borrowing_list')
+            form.add_error(None, 'This book is not available for borrowing.')
     else:
         form = BorrowingForm()
         if book:
@@ -401,7 +527,7 @@ def borrowing_create(request, book_pk=None):
 @login_required
 def borrowing_return(request, pk):
     """Mark a borrowing as returned - Login required"""
-    borrowing = get_object_or_404(Borrowing, pk=pk)
+    borrowing = get_object_or_404(Borrowing.objects.select_related('book'), pk=pk)
     
     # Regular users can only return their own books
     if not request.user.is_staff and borrowing.borrower_email != request.user.email:
@@ -409,8 +535,14 @@ def borrowing_return(request, pk):
         return redirect('borrowing_list')
     
     if request.method == 'POST':
-        borrowing.is_returned = True
-        borrowing.save()
+        def return_book():
+            # A fresh row per attempt: a rolled back attempt has already filled in
+            # return_date and the stats snapshot of the instance it saved
+            returning = Borrowing.objects.select_related('book').get(pk=borrowing.pk)
+            returning.is_returned = True
+            returning.save()
+
+        run_atomic(return_book)
         messages.success(request, 'Book returned successfully!')
         return redirect('borrowing_list')
     
@@ -34,9 +34,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings include the rest of the stack
+    'library.performance.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    # Reads of a client that just wrote stay off the lagging read replica
+    'library.db.PinPrimaryMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -47,7 +51,8 @@ ROOT_URLCONF = 'library_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render timing for PerformanceMiddleware
+        'BACKEND': 'library.performance.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -71,9 +76,54 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than shared-cache memory, so the concurrency tests in
+        # library/tests.py wait on locks the way the real database does
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# Pragmas applied to each new SQLite connection by library.db.configure_sqlite
+LIBRARY_SQLITE_PRAGMAS = {}
+# Database alias that @use_read_replica views read library data from (None = primary only)
+LIBRARY_READ_REPLICA = None
+# Seconds a client's reads stay on the primary after it sent a write, longer
+# than the replica takes to catch up
+LIBRARY_READ_REPLICA_PIN_SECONDS = 30
+# Seconds before the replica's applied migrations are compared with the primary's
+# again; until they match (e.g. right after a migrate) reads stay on the primary
+LIBRARY_READ_REPLICA_CHECK_SECONDS = 10
+# Retries of run_atomic() writes that hit "database is locked", with exponential backoff
+LIBRARY_DB_LOCK_RETRIES = 3
+LIBRARY_DB_LOCK_RETRY_DELAY = 0.05
+
+# Production profile (LIBRARY_DB_PROFILE=production): WAL so readers never block
+# on the borrow/return writers, connections reused across requests, a longer
+# busy timeout and read-only views served from a replica file kept current by
+# `manage.py sync_read_replica --interval 5`
+LIBRARY_DB_PROFILE = os.environ.get('LIBRARY_DB_PROFILE', 'development')
+if LIBRARY_DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        # Seconds a connection waits for a write lock before "database is locked"
+        'OPTIONS': {'timeout': 20},
+    })
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['library.db.ReadReplicaRouter']
+    LIBRARY_READ_REPLICA = 'replica'
+    LIBRARY_SQLITE_PRAGMAS = {
+        'journal_mode': 'wal',
+        # Durable at each checkpoint rather than each commit, safe with WAL
+        'synchronous': 'normal',
+        'temp_store': 'memory',
+        'cache_size': -32000,  # KiB
+        'mmap_size': 268435456,
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -113,6 +163,23 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
+# collectstatic output: content-hashed names plus .gz/.br siblings
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    # Run `collectstatic` before deploying: until then pages link the unhashed
+    # file names, without the far-future caching or pre-compressed variants
+    'staticfiles': {
+        'BACKEND': 'library_project.staticfiles.PrecompressedManifestStaticFilesStorage',
+    },
+}
+
+# Let Django serve STATIC_ROOT with far-future cache headers when DEBUG is off
+# (leave False when nginx/a CDN serves /static/)
+LIBRARY_SERVE_STATIC = False
 
 # Media files
 MEDIA_URL = '/media/'
@@ -128,3 +195,73 @@ LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 
+# Sessions and the logged-in user are read from the cache on each request
+# (library/auth.py); sessions are still written through to the database, so
+# they survive a cache restart. Sessions created with the previous backend
+# path have to log in again once
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+AUTHENTICATION_BACKENDS = ['library.auth.CachedModelBackend']
+LIBRARY_USER_CACHE_TIMEOUT = 60 * 60
+
+# Due-soon/overdue reminders (manage.py send_reminders). The console backend
+# prints emails; configure SMTP (EMAIL_HOST etc.) in production
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'library@localhost'
+
+# Cache used for per-user borrowed-book sets and other derived data
+# Use a shared backend (Redis/Memcached) when running several worker processes,
+# otherwise invalidations only reach the process that made the change
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        # Room for the cached book fragments and their version tokens
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    }
+}
+LIBRARY_BORROWED_CACHE_TIMEOUT = 60 * 60 * 24
+# Lifetime of the cached book card / detail fragments, they are also
+# invalidated through per-book versions whenever the data changes
+LIBRARY_FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+# Anonymous full-page cache of the catalog pages (library/pagecache.py).
+# Entries are purged by signals when the data changes, the timeout only
+# bounds how long unused pages take up memory; 0 disables the page cache
+LIBRARY_PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Route home/book_list/book_detail and the content views to the native async
+# implementations in library/async_views.py (enable when serving via ASGI,
+# e.g. `uvicorn library_project.asgi:application`)
+LIBRARY_ASYNC_VIEWS = False
+
+# Catalog search backend used by book_list
+# Use 'library.search.IcontainsSearchBackend' to disable the FTS5 index
+LIBRARY_SEARCH_BACKEND = 'library.search.SQLiteFTSSearchBackend'
+
+# Request instrumentation (library.performance.PerformanceMiddleware): log
+# requests slower than this many ms with their slowest queries (None = off),
+# send a Server-Timing header, and keep this many recent samples per view for
+# the staff-only /performance/ endpoint
+LIBRARY_SLOW_REQUEST_MS = 500
+LIBRARY_SERVER_TIMING = True
+LIBRARY_PERFORMANCE_SAMPLES = 1000
+
+# Seconds before a worker rebuilds its in-process autocomplete index in the
+# background; signals only update the index of the process that saved the
+# change (None = never)
+LIBRARY_AUTOCOMPLETE_MAX_AGE = 600
+
+# Hand book content transfers to the front-end server after the borrow check:
+# None (serve from Django), 'x-sendfile' (Apache/lighttpd) or 'x-accel-redirect'
+# (nginx, with an internal location at LIBRARY_SENDFILE_URL_PREFIX aliased to MEDIA_ROOT)
+LIBRARY_SENDFILE_BACKEND = None
+LIBRARY_SENDFILE_URL_PREFIX = '/protected-media/'
+
+# Split uploaded PDF content into single-page files with a page text index
+# in a background thread (library/pages.py, needs the optional `pypdf`
+# package). When False, run `manage.py split_book_content` instead, e.g. from cron
+LIBRARY_SPLIT_CONTENT_ON_SAVE = True
+
+# Keyset pagination for book/author/borrowing lists (False = numbered pages)
+LIBRARY_CURSOR_PAGINATION = True
+# Show a cached "About N results" total on cursor-paginated lists
+LIBRARY_PAGINATION_APPROXIMATE_COUNT = False
+
@@ -0,0 +1,123 @@
+"""
+Static asset pipeline.
+
+collectstatic writes content-hashed copies of every file (via
+ManifestStaticFilesStorage) plus pre-compressed .gz and, when the optional
+`brotli` package is installed, .br siblings of text assets. serve_static then
+sends the best encoding the browser accepts with far-future cache headers for
+hashed names, so repeat visits fetch nothing.
+"""
+import gzip
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always produced
+    brotli = None
+
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.txt', '.html', '.json', '.map', '.xml')
+# ManifestStaticFilesStorage inserts a 12 character md5 prefix before the extension
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=3600'
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+class PrecompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Hashed static files with .gz/.br siblings written at collectstatic time"""
+
+    # Before collectstatic has run (fresh checkouts, the test runner, which
+    # forces DEBUG off) templates link the unhashed names instead of failing
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Not in the manifest and not collected into STATIC_ROOT either
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for name in list(self.hashed_files.values()) + list(paths):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS) and self.exists(name):
+                self.compress(name)
+
+    def compress(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as handle:
+            content = handle.read()
+        variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(content, quality=11)))
+        for suffix, compressed in variants:
+            # Only keep encodings that actually save bytes
+            if len(compressed) < len(content):
+                with open(path + suffix, 'wb') as handle:
+                    handle.write(compressed)
+
+
+def find_static_file(path):
+    """Absolute path of a static file, from STATIC_ROOT or the finders in DEBUG"""
+    if settings.DEBUG:
+        found = finders.find(path)
+        if found:
+            return found
+    if not settings.STATIC_ROOT:
+        raise Http404('Static file not found')
+    try:
+        return safe_join(settings.STATIC_ROOT, path)
+    except ValueError:
+        raise Http404('Static file not found')
+
+
+def serve_static(request, path):
+    """
+    Serve a static file with far-future caching and pre-compressed encodings.
+
+    Intended for deployments without a separate static server; a CDN or nginx
+    in front of STATIC_ROOT remains the faster option.
+    """
+    full_path = find_static_file(path)
+    try:
+        file_stat = os.stat(full_path)
+    except OSError:
+        raise Http404('Static file not found')
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404('Static file not found')
+
+    cache_control = IMMUTABLE_CACHE_CONTROL if HASHED_NAME_RE.search(path) else DEFAULT_CACHE_CONTROL
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), file_stat.st_mtime):
+        response = HttpResponseNotModified()
+        response['Cache-Control'] = cache_control
+        return response
+
+    content_type, _ = mimetypes.guess_type(full_path)
+    accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    serve_path, encoding = full_path, None
+    for candidate, suffix in ENCODINGS:
+        if candidate in accepted and os.path.exists(full_path + suffix):
+            serve_path, encoding = full_path + suffix, candidate
+            break
+
+    response = FileResponse(open(serve_path, 'rb'), content_type=content_type or 'application/octet-stream')
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Vary'] = 'Accept-Encoding'
+    response['Last-Modified'] = http_date(file_stat.st_mtime)
+    response['Cache-Control'] = cache_control
+    return response